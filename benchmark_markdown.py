@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Micro-benchmark do escape de Markdown V2 usado pelo bot.
+
+Compara o escape antigo (18 passadas de str.replace), as alternativas de
+passada única (str.translate e regex pré-compilada), o escape_markdown
+atual e a renderização por modelo (md), que escapa só os valores
+dinâmicos. Usa mensagens realistas de ~4 KB.
+
+Uso: python3 benchmark_markdown.py [repetições]
+"""
+import random
+import re
+import sys
+import timeit
+
+from telegram_terminal_bot import escape_markdown, md
+
+CARACTERES = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+
+def escape_markdown_antigo(text: str) -> str:
+    """Implementação anterior: uma cópia da string por caractere especial"""
+    for char in CARACTERES:
+        text = text.replace(char, f"\\{char}")
+    return text
+
+TABELA = str.maketrans({c: "\\" + c for c in "\\" + "".join(CARACTERES)})
+REGEX = re.compile(r"[\\_*\[\]()~`>#+\-=|{}.!]")
+
+def escape_markdown_translate(text: str) -> str:
+    return text.translate(TABELA)
+
+def escape_markdown_regex(text: str) -> str:
+    return REGEX.sub(r"\\\g<0>", text)
+
+def gerar_processos(quantidade: int = 27):
+    aleatorio = random.Random(42)
+    nomes = ["python3", "nginx: worker", "postgres", "node_exporter", "systemd-journal", "java", "[kworker/0:1-events]"]
+    return [
+        (aleatorio.choice(nomes), aleatorio.randint(1, 99999), aleatorio.random() * 100,
+         aleatorio.random() * 20, aleatorio.choice(["running", "sleeping"]), "www-data")
+        for _ in range(quantidade)
+    ]
+
+def montar_texto(processos) -> str:
+    texto = "🔄 *Top Processos*\n\n"
+    for nome, pid, cpu, ram, status, usuario in processos:
+        texto += (
+            f"📌 *{nome[:20]}*\n"
+            f"  • PID: `{pid}`\n"
+            f"  • CPU: {cpu:.1f}%\n"
+            f"  • RAM: {ram:.1f}%\n"
+            f"  • Status: {status}\n"
+            f"  • Usuário: {usuario}\n\n"
+        )
+    return texto
+
+def renderizar_modelo(processos) -> str:
+    texto = md("🔄 *Top Processos*\n\n")
+    for nome, pid, cpu, ram, status, usuario in processos:
+        texto += md(
+            "📌 *{}*\n"
+            "  • PID: `{}`\n"
+            "  • CPU: {:.1f}%\n"
+            "  • RAM: {:.1f}%\n"
+            "  • Status: {}\n"
+            "  • Usuário: {}\n\n",
+            nome[:20], pid, cpu, ram, status, usuario
+        )
+    return texto
+
+def medir(nome: str, func, repeticoes: int, tamanho: int):
+    tempo = min(timeit.repeat(func, number=repeticoes, repeat=5))
+    por_mensagem = tempo / repeticoes * 1e6
+    mb_s = tamanho * repeticoes / tempo / 1024 / 1024
+    print(f"{nome:<38} {por_mensagem:9.1f} µs/msg {mb_s:9.1f} MB/s")
+    return tempo
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    processos = gerar_processos()
+    texto = montar_texto(processos)
+    saida_log = ("Oct 18 06:00:01 host CRON[123]: (root) CMD (run-parts /etc/cron.hourly) [ok] {x=1}!\n" * 50)[:4096]
+    
+    for func in (escape_markdown, escape_markdown_translate, escape_markdown_regex):
+        assert func(texto) == escape_markdown_antigo(texto)
+    
+    for titulo, mensagem in (("Mensagem de processos", texto), ("Saída de comando", saida_log)):
+        tamanho = len(mensagem.encode("utf-8"))
+        print(f"{titulo}: {tamanho} bytes, {repeticoes} repetições\n")
+        antigo = medir("escape antigo (18x str.replace)", lambda: escape_markdown_antigo(mensagem), repeticoes, tamanho)
+        medir("passada única (str.translate)", lambda: escape_markdown_translate(mensagem), repeticoes, tamanho)
+        medir("passada única (regex)", lambda: escape_markdown_regex(mensagem), repeticoes, tamanho)
+        atual = medir("escape_markdown", lambda: escape_markdown(mensagem), repeticoes, tamanho)
+        print(f"escape_markdown vs antigo: {antigo / atual:.2f}x\n")
+    
+    tamanho = len(texto.encode("utf-8"))
+    print("Renderização completa da lista de processos\n")
+    medir("f-string + escape da mensagem inteira", lambda: escape_markdown(montar_texto(processos)), repeticoes, tamanho)
+    medir("md() (só valores escapados)", lambda: renderizar_modelo(processos), repeticoes, tamanho)
+
+if __name__ == "__main__":
+    main()
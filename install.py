@@ -56,6 +56,15 @@ def is_debian_based():
     """Verifica se é um sistema baseado em Debian"""
     return os.path.exists("/etc/debian_version")
 
+def salvar_config(config):
+    """Grava o config.json de forma atômica (o bot recarrega o arquivo em execução)"""
+    temporario = "config.json.tmp"
+    with open(temporario, "w") as f:
+        json.dump(config, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, "config.json")
+
 def instalar_dependencias():
     print(f"\n{Cores.HEADER}📦 Instalando dependências...{Cores.END}")
     
@@ -96,7 +105,7 @@ def instalar_dependencias():
                 
                 # Instala dependências individualmente
                 dependencies = [
-                    "python-telegram-bot==20.8",
+                    "python-telegram-bot[job-queue]==20.8",
                     "psutil==5.9.8",
                     "requests==2.31.0",
                     "speedtest-cli==2.1.3",
@@ -173,8 +182,7 @@ def configurar_bot():
             print(f"{Cores.FAIL}❌ ID inválido! Digite apenas números.{Cores.END}")
     
     # Salva a configuração
-    with open("config.json", "w") as f:
-        json.dump(config, f, indent=4)
+    salvar_config(config)
     
     print(f"{Cores.GREEN}✅ Configuração salva com sucesso!{Cores.END}")
 
@@ -397,8 +405,7 @@ def gerenciar_usuarios():
                         config = json.load(f)
                     if id_novo not in config["ids_autorizados"]:
                         config["ids_autorizados"].append(id_novo)
-                        with open("config.json", "w") as f:
-                            json.dump(config, f, indent=4)
+                        salvar_config(config)
                         print(f"{Cores.GREEN}✅ Usuário adicionado!{Cores.END}")
                     else:
                         print(f"{Cores.WARNING}⚠️ Usuário já autorizado!{Cores.END}")
@@ -412,8 +419,7 @@ def gerenciar_usuarios():
                         config = json.load(f)
                     if id_remover in config["ids_autorizados"]:
                         config["ids_autorizados"].remove(id_remover)
-                        with open("config.json", "w") as f:
-                            json.dump(config, f, indent=4)
+                        salvar_config(config)
                         print(f"{Cores.GREEN}✅ Usuário removido!{Cores.END}")
                     else:
                         print(f"{Cores.WARNING}⚠️ Usuário não encontrado!{Cores.END}")
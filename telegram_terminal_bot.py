@@ -15,11 +15,43 @@ import socket
 import shutil
 import glob
 import threading
+import heapq
+import itertools
+import tempfile
+import math
+import string
+import functools
+import contextlib
+import shlex
+import pty
+import termios
+import secrets
+import zlib
+import hmac
+import ssl
+import sqlite3
+import queue
+import hashlib
+import sys
+from collections import deque, OrderedDict
 import requests
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from aiohttp import web
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.error import TelegramError, RetryAfter, NetworkError
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler,
+    ApplicationHandlerStop, ContextTypes, filters
+)
 from telegram.constants import ParseMode
 
 # Configuração de logging
@@ -34,12 +66,36 @@ try:
     with open('config.json', 'r') as f:
         CONFIG = json.load(f)
         TOKEN = CONFIG['token']
-        DONO_USERNAME = CONFIG['dono_username'].lower()
-        IDS_AUTORIZADOS = CONFIG['ids_autorizados']
+        TIMEOUT_COMANDO = CONFIG.get('timeout_comando', 30)
+        MAX_COMANDOS_SIMULTANEOS = CONFIG.get('max_comandos_simultaneos', 2)
+        MAX_FILA_USUARIO = CONFIG.get('max_fila_usuario', 5)
+        COMANDOS_BAIXA_PRIORIDADE = CONFIG.get('comandos_baixa_prioridade', True)
 except Exception as e:
     logger.error(f"Erro ao carregar configurações: {e}")
     exit(1)
 
+# Recebimento de updates: só os tipos que o bot trata
+ATUALIZACOES_TRATADAS = [Update.MESSAGE, Update.CALLBACK_QUERY]
+CONFIG_WEBHOOK = CONFIG.get("webhook", {})
+# URL alternativa da Bot API (servidor próprio ou falso, para testes)
+URL_API = CONFIG.get("url_api")
+
+# Frota: um bot controlando vários servidores por meio de agentes
+CONFIG_FROTA = CONFIG.get("frota", {})
+AGENTES_FROTA: Dict[str, str] = CONFIG_FROTA.get("agentes", {})
+TOKEN_FROTA = CONFIG_FROTA.get("token", "")
+HOST_LOCAL = "local"
+TIMEOUT_RPC = CONFIG_FROTA.get("timeout", 10)
+JANELA_ASSINATURA_RPC = 60
+MAX_NONCES_VISTOS = 100000
+MAX_CONEXOES_FROTA = 100
+
+# Controle de acesso
+INTERVALO_RECARGA_CONFIG = 2.0
+JANELA_TENTATIVAS = 600
+DURACAO_BLOQUEIO = 3600
+MAX_REGISTROS_ACESSO = 10000
+
 # Constantes
 MENU_PRINCIPAL = "menu_principal"
 MENU_SISTEMA = "menu_sistema"
@@ -48,49 +104,1264 @@ MENU_SERVICOS = "menu_servicos"
 MENU_SEGURANCA = "menu_seguranca"
 MENU_REDE = "menu_rede"
 MENU_LOGS = "menu_logs"
+MENU_HISTORICO = "menu_historico"
+MENU_FROTA = "menu_frota"
 
 # Constantes para alertas
-LIMITE_CPU = 80
-LIMITE_RAM = 80
-LIMITE_DISCO = 85
-INTERVALO_MONITORAMENTO = 60
-
-# Cache para evitar alertas repetidos
-alertas_enviados = {
-    "cpu": False,
-    "ram": False,
-    "disco": False,
-    "processos": set(),
-    "usuarios": set()
+CONFIG_ALERTAS = CONFIG.get("alertas", {})
+LIMITES_ALERTA = {
+    "cpu": 80,
+    "ram": 80,
+    "disco": 85,
+    "swap": 80,
+    "inodes": 90,
+    "load": 2.0,
+    "processos": 2000,
+    "rede": 100,
+    **CONFIG_ALERTAS.get("limites", {})
+}
+NOTIFICACOES = CONFIG.get("notificacoes", {})
+INTERVALO_MONITORAMENTO = CONFIG_ALERTAS.get("intervalo_monitoramento", 60)
+DURACAO_ALERTA = CONFIG_ALERTAS.get("duracao", 60)
+COOLDOWN_ALERTA = CONFIG_ALERTAS.get("cooldown", 1800)
+HISTERESE_ALERTA = CONFIG_ALERTAS.get("histerese", 5)
+INTERVALO_AMOSTRAGEM = 5
+GB = 1024 ** 3
+
+# Limites de envio do Telegram
+ENVIOS_POR_SEGUNDO = 25
+INTERVALO_POR_CHAT = 1.0
+TENTATIVAS_ENVIO = 4
+
+# Limite de requisições por usuário (token bucket)
+REQUISICOES_POR_SEGUNDO = CONFIG.get("requisicoes_por_segundo", 1.0)
+RAJADA_REQUISICOES = CONFIG.get("rajada_requisicoes", 5)
+MAX_USUARIOS_LIMITADOR = 10000
+FS_IGNORADOS = {"squashfs", "tmpfs", "devtmpfs", "overlay", "iso9660"}
+
+# Histórico de métricas (24h com resolução de 10s)
+RESOLUCAO_HISTORICO = 10
+JANELA_HISTORICO = 24 * 3600
+PERIODOS_HISTORICO = {"1h": 3600, "6h": 6 * 3600, "24h": 24 * 3600}
+
+# Tabela de processos
+INTERVALO_PROCESSOS = 5
+CRITERIOS_PROCESSOS = {"cpu": "💻 CPU", "memoria": "🧠 RAM", "io": "💽 I/O"}
+
+# Execução de tarefas bloqueantes
+MAX_TAREFAS_BLOQUEANTES = 4
+TIMEOUT_TAREFA_PADRAO = 15
+TIMEOUT_SPEEDTEST = 120
+TIMEOUT_HTTP = 5
+TIMEOUT_UPLOAD = 300
+LIMITES_GRUPOS_TAREFAS = {"speedtest": 1, "seguranca": 1, "diretorios": 1, "transferencia": 2}
+
+# Cache com TTL por chave (segundos)
+TTLS_CACHE = {
+    "ip_publico": 600,
+    "speedtest": 900,
+    "conexoes": 5,
+    "interfaces": 5,
+    "servicos": 5,
+    "diretorios": 600
+}
+TTL_CACHE_PADRAO = 30
+
+# Saída de comandos
+LIMITE_MENSAGEM = 4096
+LIMITE_CAUDA_SAIDA = 3000
+INTERVALO_EDICAO = 2.0
+TAMANHO_BLOCO_LEITURA = 4096
+# Quanto da saída de um comando vai para o arquivo temporário (e depois para o chat)
+MAX_SAIDA_ARQUIVO = int(CONFIG.get("max_saida_arquivo_mb", 100) * 1024 * 1024)
+NICE_COMANDOS = 10
+# nice/ionice por argv; ionice -t ignora falta de permissão para a classe idle
+PREFIXO_BAIXA_PRIORIDADE = (
+    (["nice", "-n", str(NICE_COMANDOS)] if shutil.which("nice") else []) +
+    (["ionice", "-c", "3", "-t"] if shutil.which("ionice") else [])
+)
+
+# Envio de arquivos (/get e saídas grandes)
+TAMANHO_PARTE_ENVIO = int(CONFIG.get("tamanho_parte_envio_mb", 45) * 1024 * 1024)
+TAMANHO_BLOCO_ENVIO = 1024 * 1024
+LIMITE_COMPRIMIR_SAIDA = 1024 * 1024
+COMPRESSOES = {"gz": ".gz", "zst": ".zst"}
+
+# Paginação de mensagens longas
+RESERVA_RODAPE_PAGINA = 64
+MAX_MENSAGENS_PAGINADAS = 256
+
+# Visualizador de logs
+LOGS_PADRAO = {
+    "sistema": ["/var/log/syslog", "/var/log/messages"],
+    "seguranca": ["/var/log/auth.log", "/var/log/secure"]
+}
+ROTULOS_LOGS = {"sistema": "🖥️ Sistema", "seguranca": "🔒 Segurança"}
+LOGS_CONFIGURADOS = {**LOGS_PADRAO, **{nome: [caminho] for nome, caminho in CONFIG.get("logs", {}).items()}}
+TAMANHO_BLOCO_LOG = 8192
+TAMANHO_PAGINA_LOG = 3000
+MAX_LINHAS_PAGINA_LOG = 60
+MAX_CARACTERES_LINHA_LOG = 400
+
+# Acompanhamento de logs (/tail)
+INTERVALO_TAIL = 1.0
+MAX_BYTES_LEITURA_TAIL = 4 * 1024 * 1024
+MAX_LINHAS_TAIL = 50
+MAX_TAILS_USUARIO = 2
+DURACAO_MAXIMA_TAIL = CONFIG.get("duracao_maxima_tail", 600)
+
+# Análise de segurança (falhas de login SSH)
+BANCO_SEGURANCA = CONFIG.get("banco_seguranca", "seguranca.db")
+RETENCAO_SEGURANCA = 30 * 24 * 3600
+MAX_BYTES_ANALISE = 64 * 1024 * 1024
+TOP_OFENSORES = 10
+TIMEOUT_ANALISE = 60
+
+# Medição de diretórios (maiores pastas)
+TRABALHADORES_DIRETORIOS = 8
+PROFUNDIDADE_DIRETORIOS = 64
+ORCAMENTO_DIRETORIOS = 20.0
+TOP_DIRETORIOS = 12
+MAX_CAMINHOS_CALLBACK = 512
+
+# Sessões de shell persistentes (/shell)
+SHELL_INTERATIVO = CONFIG.get("shell_interativo", True)
+MAX_SESSOES_SHELL = 5
+TEMPO_OCIOSO_SHELL = CONFIG.get("tempo_ocioso_shell", 900)
+INTERVALO_RECOLHER_SHELL = 60
+TIMEOUT_INICIO_SHELL = 5
+# Builtins que só fazem sentido numa sessão persistente
+BUILTINS_SESSAO = frozenset({"cd", "pushd", "popd", "dirs", "export", "unset", "pwd"})
+
+# Resumo de conexões
+TOP_CONEXOES = 5
+
+# Serviços systemd monitorados
+SERVICOS_MONITORADOS = CONFIG.get("servicos", ["ssh", "cron"])
+COMANDO_SYSTEMCTL = CONFIG.get("comando_systemctl", "systemctl")
+PROPRIEDADES_SERVICO = ("Id", "LoadState", "ActiveState", "SubState", "Description", "MainPID")
+EMOJIS_SERVICO = {
+    "active": "🟢", "failed": "🔴", "inactive": "⚪",
+    "activating": "🟡", "deactivating": "🟡", "reloading": "🟡"
 }
 
+def listar_discos() -> List[Dict[str, Any]]:
+    """Espaço e inodes de cada ponto de montagem real (um statvfs por montagem)"""
+    discos = []
+    vistos = set()
+    for part in psutil.disk_partitions(all=False):
+        if part.fstype in FS_IGNORADOS or part.mountpoint in vistos:
+            continue
+        try:
+            st = os.statvfs(part.mountpoint)
+        except OSError:
+            continue
+        vistos.add(part.mountpoint)
+        usado = (st.f_blocks - st.f_bfree) * st.f_frsize
+        disponivel = st.f_bavail * st.f_frsize
+        inodes_usados = st.f_files - st.f_ffree
+        discos.append({
+            "ponto": part.mountpoint,
+            "dispositivo": part.device,
+            "tipo": part.fstype,
+            "total": st.f_blocks * st.f_frsize,
+            "usado": usado,
+            "livre": disponivel,
+            "uso": usado / (usado + disponivel) * 100 if usado + disponivel else 0.0,
+            "inodes_total": st.f_files,
+            "inodes_usados": inodes_usados,
+            "inodes": inodes_usados / st.f_files * 100 if st.f_files else 0.0
+        })
+    return discos
+
+class AmostradorMetricas:
+    """Coleta métricas do sistema em segundo plano e guarda o último snapshot"""
+
+    def __init__(self, intervalo: float = INTERVALO_AMOSTRAGEM):
+        self.intervalo = intervalo
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._pronto = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def iniciar(self):
+        """Inicia a thread de amostragem (idempotente)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        # Primeira chamada só inicializa o contador interno do psutil
+        psutil.cpu_percent(interval=None)
+        self._thread = threading.Thread(target=self._loop, name="amostrador-metricas", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    @staticmethod
+    def _coletar_montagens() -> Dict[str, tuple]:
+        """Uso de espaço e de inodes (%) de cada ponto de montagem real"""
+        return {disco["ponto"]: (disco["uso"], disco["inodes"]) for disco in listar_discos()}
+
+    def _coletar(self) -> Dict[str, Any]:
+        return {
+            "timestamp": time.time(),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "cpu_freq": psutil.cpu_freq(),
+            "cpu_count": psutil.cpu_count(),
+            "mem": psutil.virtual_memory(),
+            "swap": psutil.swap_memory(),
+            "disk": psutil.disk_usage('/'),
+            "net": psutil.net_io_counters(),
+            "net_pernic": psutil.net_io_counters(pernic=True),
+            "montagens": self._coletar_montagens(),
+            "load": os.getloadavg(),
+            "processos": len(psutil.pids()),
+            "boot_time": psutil.boot_time()
+        }
+
+    @staticmethod
+    def _calcular_taxas(anterior: Dict[str, Any], atual: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+        """Taxas por segundo de cada interface a partir de dois snapshots consecutivos"""
+        dt = atual["timestamp"] - anterior["timestamp"]
+        if dt <= 0:
+            return {}
+        taxas = {}
+        contadores_anteriores = anterior["net_pernic"]
+        for nome, io in atual["net_pernic"].items():
+            ant = contadores_anteriores.get(nome)
+            if ant is None:
+                continue
+            # Contadores zerados (interface recriada) viram taxa 0, não negativa
+            taxas[nome] = {
+                "rx": max(io.bytes_recv - ant.bytes_recv, 0) / dt,
+                "tx": max(io.bytes_sent - ant.bytes_sent, 0) / dt,
+                "pacotes_rx": max(io.packets_recv - ant.packets_recv, 0) / dt,
+                "pacotes_tx": max(io.packets_sent - ant.packets_sent, 0) / dt,
+                "erros": max(io.errin + io.errout - ant.errin - ant.errout, 0) / dt,
+                "descartes": max(io.dropin + io.dropout - ant.dropin - ant.dropout, 0) / dt
+            }
+        return taxas
+
+    def _loop(self):
+        logger.info("Iniciando amostragem de métricas a cada %ss", self.intervalo)
+        # O primeiro snapshot sai logo após a partida; os demais seguem o intervalo
+        espera = min(self.intervalo, 1)
+        while not self._parar.wait(espera):
+            espera = self.intervalo
+            try:
+                snapshot = self._coletar()
+                anterior = self._snapshot
+                snapshot["taxas_rede"] = self._calcular_taxas(anterior, snapshot) if anterior else {}
+                with self._lock:
+                    self._snapshot = snapshot
+                self._pronto.set()
+            except Exception as e:
+                logger.error(f"Erro na amostragem de métricas: {e}")
+
+    def snapshot(self, timeout: float = 0) -> Optional[Dict[str, Any]]:
+        """Retorna o último snapshot coletado (None se ainda não houver)"""
+        if timeout and not self._pronto.is_set():
+            self._pronto.wait(timeout)
+        with self._lock:
+            return self._snapshot
+
+    async def snapshot_async(self, timeout: float = 2) -> Optional[Dict[str, Any]]:
+        """Versão assíncrona: espera o primeiro snapshot sem bloquear o event loop"""
+        inicio = time.monotonic()
+        while not self._pronto.is_set() and time.monotonic() - inicio < timeout:
+            await asyncio.sleep(0.05)
+        return self.snapshot()
+
+amostrador = AmostradorMetricas()
+
+class HistoricoMetricas:
+    """Buffer circular de tamanho fixo com séries numéricas compactas"""
+
+    SERIES = ("cpu", "ram", "disco", "rede_rx", "rede_tx")
+    BLOCOS_SPARKLINE = "▁▂▃▄▅▆▇█"
+
+    def __init__(self, janela: int = JANELA_HISTORICO, resolucao: int = RESOLUCAO_HISTORICO):
+        self.resolucao = resolucao
+        self.capacidade = janela // resolucao
+        self._tempos = array('d', [0.0]) * self.capacidade
+        self._series = {nome: array('f', [0.0]) * self.capacidade for nome in self.SERIES}
+        self._proximo = 0
+        self._tamanho = 0
+        self._ultima_rede = None
+        self._lock = threading.Lock()
+
+    def registrar(self, amostra: Dict[str, Any]):
+        """Grava uma amostra; contadores de rede viram taxas em bytes/s"""
+        ts = amostra["timestamp"]
+        net = amostra.get("net")
+        rx = tx = 0.0
+        with self._lock:
+            if self._tamanho and ts <= self._tempos[(self._proximo - 1) % self.capacidade]:
+                return
+            if net is not None:
+                if self._ultima_rede is not None:
+                    ts_ant, rx_ant, tx_ant = self._ultima_rede
+                    dt = ts - ts_ant
+                    if dt > 0:
+                        # Contadores podem reiniciar (overflow/reboot): nunca gera taxa negativa
+                        rx = max(net.bytes_recv - rx_ant, 0) / dt
+                        tx = max(net.bytes_sent - tx_ant, 0) / dt
+                self._ultima_rede = (ts, net.bytes_recv, net.bytes_sent)
+            
+            i = self._proximo
+            self._tempos[i] = ts
+            self._series["cpu"][i] = amostra["cpu_percent"]
+            self._series["ram"][i] = amostra["mem"].percent
+            self._series["disco"][i] = amostra["disk"].percent
+            self._series["rede_rx"][i] = rx
+            self._series["rede_tx"][i] = tx
+            self._proximo = (i + 1) % self.capacidade
+            self._tamanho = min(self._tamanho + 1, self.capacidade)
+
+    def janela(self, segundos: int, agora: Optional[float] = None) -> Dict[str, List[float]]:
+        """Retorna as séries (em ordem cronológica) dos últimos `segundos`"""
+        agora = agora if agora is not None else time.time()
+        limite = agora - segundos
+        with self._lock:
+            inicio = (self._proximo - self._tamanho) % self.capacidade
+            indices = [(inicio + k) % self.capacidade for k in range(self._tamanho)]
+            indices = [i for i in indices if self._tempos[i] >= limite]
+            return {nome: [serie[i] for i in indices] for nome, serie in self._series.items()}
+
+    @staticmethod
+    def resumo(valores: List[float]) -> Optional[Dict[str, float]]:
+        """Calcula min/média/max/p95 de uma série"""
+        if not valores:
+            return None
+        ordenados = sorted(valores)
+        p95 = ordenados[min(len(ordenados) - 1, int(round(0.95 * (len(ordenados) - 1))))]
+        return {
+            "min": ordenados[0],
+            "avg": sum(ordenados) / len(ordenados),
+            "max": ordenados[-1],
+            "p95": p95
+        }
+
+    @classmethod
+    def sparkline(cls, valores: List[float], largura: int = 24) -> str:
+        """Reduz a série para `largura` baldes (média) e desenha em blocos"""
+        if not valores:
+            return ""
+        n = len(valores)
+        if n > largura:
+            baldes = []
+            for b in range(largura):
+                parte = valores[b * n // largura:(b + 1) * n // largura]
+                baldes.append(sum(parte) / len(parte))
+            valores = baldes
+        minimo, maximo = min(valores), max(valores)
+        escala = (maximo - minimo) or 1.0
+        niveis = len(cls.BLOCOS_SPARKLINE) - 1
+        return "".join(cls.BLOCOS_SPARKLINE[int((v - minimo) / escala * niveis)] for v in valores)
+
+historico = HistoricoMetricas()
+
+class MotorAlertas:
+    """Avalia todas as regras de alerta de uma vez sobre colunas paralelas.
+
+    Cada regra é uma métrica (ex.: "disco:/home") com limite, limite de
+    recuperação (histerese), duração mínima acima do limite e cooldown
+    entre envios. O estado das regras fica em arrays numéricos, então o
+    custo por tick é uma única passada, independente do tipo de regra.
+    """
+
+    # prefixo: (rótulo, unidade, chave em "notificacoes")
+    TIPOS = {
+        "cpu": ("CPU", "%", "cpu"),
+        "load": ("Load por núcleo", "", "cpu"),
+        "ram": ("RAM", "%", "ram"),
+        "swap": ("Swap", "%", "ram"),
+        "disco": ("Disco", "%", "disco"),
+        "inodes": ("Inodes", "%", "disco"),
+        "processos": ("Processos", "", "processos"),
+        "rede": ("Tráfego", " MB/s", "rede")
+    }
+
+    def __init__(self, limites: Dict[str, float] = LIMITES_ALERTA, notificacoes: Dict[str, bool] = NOTIFICACOES,
+                 duracao: float = DURACAO_ALERTA, cooldown: float = COOLDOWN_ALERTA,
+                 histerese: float = HISTERESE_ALERTA):
+        self.limites = limites
+        self.notificacoes = notificacoes
+        self.duracao = duracao
+        self.cooldown = cooldown
+        self.histerese = histerese
+        self._nomes: List[str] = []
+        self._indices: Dict[str, int] = {}
+        self._limites = array('d')
+        self._recuperacao = array('d')
+        self._acima_desde = array('d')
+        self._ultimo_envio = array('d')
+        self._ativo = bytearray()
+
+    def _habilitado(self, prefixo: str) -> bool:
+        tipo = self.TIPOS.get(prefixo)
+        return bool(tipo) and self.limites.get(prefixo) is not None and self.notificacoes.get(tipo[2], True)
+
+    def extrair_metricas(self, amostra: Dict[str, Any]) -> Dict[str, float]:
+        """Achata a amostra em {nome da métrica: valor}"""
+        metricas = {
+            "cpu": amostra["cpu_percent"],
+            "ram": amostra["mem"].percent,
+            "swap": amostra["swap"].percent,
+            "load": amostra["load"][0] / (amostra["cpu_count"] or 1),
+            "processos": amostra["processos"]
+        }
+        for ponto, (uso, inodes) in amostra.get("montagens", {}).items():
+            metricas[f"disco:{ponto}"] = uso
+            metricas[f"inodes:{ponto}"] = inodes
+        
+        for nome, taxas in amostra.get("taxas_rede", {}).items():
+            if nome != "lo":
+                metricas[f"rede:{nome}"] = max(taxas["rx"], taxas["tx"]) / 1024 / 1024
+        
+        return {nome: v for nome, v in metricas.items() if self._habilitado(nome.split(":", 1)[0])}
+
+    def _adicionar_regra(self, nome: str):
+        limite = float(self.limites[nome.split(":", 1)[0]])
+        self._indices[nome] = len(self._nomes)
+        self._nomes.append(nome)
+        self._limites.append(limite)
+        self._recuperacao.append(limite * (1 - self.histerese / 100))
+        self._acima_desde.append(0.0)
+        self._ultimo_envio.append(-math.inf)
+        self._ativo.append(0)
+
+    def avaliar(self, amostra: Dict[str, Any], agora: Optional[float] = None) -> List[str]:
+        """Atualiza o estado das regras e retorna as mensagens de alerta a enviar"""
+        agora = agora if agora is not None else amostra["timestamp"]
+        metricas = self.extrair_metricas(amostra)
+        for nome in metricas:
+            if nome not in self._indices:
+                self._adicionar_regra(nome)
+        
+        # Métricas ausentes (ex.: disco desmontado) viram NaN e nunca disparam
+        valores = array('d', (metricas.get(nome, math.nan) for nome in self._nomes))
+        disparos = []
+        for i, (valor, limite, recuperacao) in enumerate(zip(valores, self._limites, self._recuperacao)):
+            if valor >= limite:
+                if not self._acima_desde[i]:
+                    self._acima_desde[i] = agora
+                if (not self._ativo[i]
+                        and agora - self._acima_desde[i] >= self.duracao
+                        and agora - self._ultimo_envio[i] >= self.cooldown):
+                    self._ativo[i] = 1
+                    self._ultimo_envio[i] = agora
+                    disparos.append(i)
+            elif not valor >= recuperacao:
+                self._acima_desde[i] = 0.0
+                self._ativo[i] = 0
+        
+        return [self._mensagem(i, valores[i], agora) for i in disparos]
+
+    def _mensagem(self, i: int, valor: float, agora: float) -> str:
+        nome = self._nomes[i]
+        prefixo, _, alvo = nome.partition(":")
+        rotulo, unidade, _ = self.TIPOS[prefixo]
+        titulo = f"{rotulo} {alvo}".strip()
+        duracao = agora - self._acima_desde[i]
+        return md(
+            "⚠️ *Alerta de {}*\n\n"
+            "Valor atual: {:.1f}{} (limite {:g}{})\n"
+            "Acima do limite há {:.0f}s",
+            titulo, valor, unidade, self._limites[i], unidade, duracao
+        )
+
+    def ativos(self) -> List[str]:
+        """Nomes das regras atualmente em alerta"""
+        return [nome for nome, ativo in zip(self._nomes, self._ativo) if ativo]
+
+motor_alertas = MotorAlertas()
+
+class _EntradaProcesso:
+    """Estado de um processo entre duas atualizações da tabela"""
+
+    __slots__ = ("proc", "pid", "create_time", "name", "username", "status",
+                 "cpu_total", "cpu_percent", "memory_percent", "io_total", "io_rate", "ts")
+
+    def __init__(self, proc: psutil.Process, create_time: float):
+        self.proc = proc
+        self.pid = proc.pid
+        self.create_time = create_time
+        self.name = "?"
+        self.username = "?"
+        self.status = "?"
+        self.cpu_total = None
+        self.cpu_percent = 0.0
+        self.memory_percent = 0.0
+        self.io_total = None
+        self.io_rate = 0.0
+        self.ts = 0.0
+
+class TabelaProcessos:
+    """Tabela persistente de processos, chaveada por (pid, create_time)"""
+
+    def __init__(self, intervalo: float = INTERVALO_PROCESSOS):
+        self.intervalo = intervalo
+        self._entradas: Dict[tuple, _EntradaProcesso] = {}
+        self._por_pid: Dict[int, tuple] = {}
+        self._passadas = 0
+        self._lock = threading.Lock()
+        self._pronto = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def iniciar(self):
+        """Inicia a thread de atualização (idempotente)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="tabela-processos", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def _loop(self):
+        logger.info("Iniciando tabela de processos a cada %ss", self.intervalo)
+        # A primeira passada só estabelece a linha de base dos contadores
+        espera = 0
+        while not self._parar.wait(espera):
+            espera = self.intervalo if self._pronto.is_set() else min(self.intervalo, 1)
+            try:
+                self.atualizar()
+            except Exception as e:
+                logger.error(f"Erro ao atualizar tabela de processos: {e}")
+
+    @staticmethod
+    def _ler(entrada: _EntradaProcesso, nova: bool) -> bool:
+        """Lê os contadores do processo; False se o PID foi reutilizado por outro"""
+        proc = entrada.proc
+        # create_time() fica em cache no objeto; is_running() compara
+        # (pid, create_time) com uma leitura nova
+        if not nova and not proc.is_running():
+            return False
+        with proc.oneshot():
+            if nova:
+                entrada.name = proc.name()
+                try:
+                    entrada.username = proc.username()
+                except (psutil.AccessDenied, KeyError):
+                    pass
+            cpu = proc.cpu_times()
+            entrada.status = proc.status()
+            entrada.memory_percent = proc.memory_percent()
+            try:
+                io = proc.io_counters()
+                io_total = io.read_bytes + io.write_bytes
+            except (psutil.AccessDenied, AttributeError):
+                io_total = None
+        agora = time.monotonic()
+        cpu_total = cpu.user + cpu.system
+        if entrada.cpu_total is not None and agora > entrada.ts:
+            dt = agora - entrada.ts
+            entrada.cpu_percent = max(cpu_total - entrada.cpu_total, 0) / dt * 100
+            if io_total is not None and entrada.io_total is not None:
+                entrada.io_rate = max(io_total - entrada.io_total, 0) / dt
+        entrada.cpu_total = cpu_total
+        entrada.io_total = io_total
+        entrada.ts = agora
+        return True
+
+    def atualizar(self):
+        """Atualiza a tabela: lê apenas contadores dos processos já conhecidos"""
+        entradas = dict(self._entradas)
+        por_pid = dict(self._por_pid)
+        vistos = set()
+        for pid in psutil.pids():
+            chave = por_pid.get(pid)
+            entrada = entradas.get(chave) if chave else None
+            try:
+                if entrada is not None:
+                    if self._ler(entrada, nova=False):
+                        vistos.add(chave)
+                        continue
+                    # PID reutilizado por outro processo
+                    entradas.pop(chave, None)
+                proc = psutil.Process(pid)
+                entrada = _EntradaProcesso(proc, proc.create_time())
+                self._ler(entrada, nova=True)
+                chave = (pid, entrada.create_time)
+                entradas[chave] = entrada
+                por_pid[pid] = chave
+                vistos.add(chave)
+            except (psutil.NoSuchProcess, psutil.ZombieProcess, psutil.AccessDenied):
+                pass
+        
+        for chave in list(entradas):
+            if chave not in vistos:
+                del entradas[chave]
+                if por_pid.get(chave[0]) == chave:
+                    del por_pid[chave[0]]
+        
+        with self._lock:
+            self._entradas = entradas
+            self._por_pid = por_pid
+        # Só marca pronto quando já existe um delta de CPU calculado
+        self._passadas += 1
+        if self._passadas >= 2:
+            self._pronto.set()
+
+    def top(self, limite: int = 10, criterio: str = "cpu") -> List[_EntradaProcesso]:
+        """Retorna os `limite` maiores processos pelo critério, via heap parcial"""
+        chaves = {
+            "cpu": lambda e: e.cpu_percent,
+            "memoria": lambda e: e.memory_percent,
+            "io": lambda e: e.io_rate
+        }
+        with self._lock:
+            entradas = list(self._entradas.values())
+        return heapq.nlargest(limite, entradas, key=chaves[criterio])
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    async def aguardar(self, timeout: float = 3):
+        """Espera a primeira medição sem bloquear o event loop"""
+        inicio = time.monotonic()
+        while not self._pronto.is_set() and time.monotonic() - inicio < timeout:
+            await asyncio.sleep(0.05)
+
+tabela_processos = TabelaProcessos()
+
+class TarefaOcupada(Exception):
+    """O grupo de tarefas já atingiu o limite de execuções simultâneas"""
+
+class TarefaCancelada(Exception):
+    """A tarefa foi cancelada na fila (/kill t<id> ou encerramento)"""
+
+class ExecutorBloqueante:
+    """Pool limitado de threads para todo trabalho bloqueante do bot"""
+
+    def __init__(self, max_workers: int = MAX_TAREFAS_BLOQUEANTES, limites: Dict[str, int] = LIMITES_GRUPOS_TAREFAS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tarefa")
+        self._grupos = {nome: threading.BoundedSemaphore(limite) for nome, limite in limites.items()}
+        self._tarefas: Dict[int, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    async def executar(self, func, *args, timeout: float = TIMEOUT_TAREFA_PADRAO,
+                       grupo: Optional[str] = None, nome: Optional[str] = None,
+                       aguardar_fim: bool = False, **kwargs):
+        """Executa `func` no pool sem bloquear o event loop.
+
+        Lança TarefaOcupada se o grupo estiver cheio e asyncio.TimeoutError
+        se a tarefa não terminar no prazo. O slot do grupo só é liberado quando
+        a função realmente termina, para que tarefas abandonadas não se acumulem.
+        Com `aguardar_fim`, timeout e cancelamento só são repassados depois que
+        a função termina (ela ainda usa recursos do chamador, como um arquivo).
+        """
+        semaforo = self._grupos.get(grupo) if grupo else None
+        if semaforo is not None and not semaforo.acquire(blocking=False):
+            raise TarefaOcupada(grupo)
+        
+        try:
+            futuro = self._pool.submit(func, *args, **kwargs)
+        except Exception:
+            if semaforo is not None:
+                semaforo.release()
+            raise
+        
+        id_tarefa = next(self._ids)
+        with self._lock:
+            self._tarefas[id_tarefa] = {
+                "nome": nome or getattr(func, "__name__", "tarefa"),
+                "grupo": grupo,
+                "inicio": time.time(),
+                "futuro": futuro
+            }
+        
+        def _finalizar(_):
+            with self._lock:
+                self._tarefas.pop(id_tarefa, None)
+            if semaforo is not None:
+                semaforo.release()
+        futuro.add_done_callback(_finalizar)
+        
+        espera = asyncio.wrap_future(futuro)
+        # Marca o erro como lido se ninguém mais esperar o resultado
+        espera.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            return await asyncio.wait_for(asyncio.shield(espera), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if futuro.cancelled():
+                # Cancelada por cancelar()/encerrar(), não pelo chamador
+                raise TarefaCancelada(id_tarefa) from None
+            if isinstance(e, asyncio.TimeoutError):
+                logger.warning(f"Tarefa {id_tarefa} ({func.__name__}) excedeu {timeout}s")
+            futuro.cancel()
+            if aguardar_fim:
+                await asyncio.wait({espera})
+            raise
+
+    def cancelar(self, id_tarefa: int) -> bool:
+        """Cancela uma tarefa que ainda está na fila"""
+        with self._lock:
+            tarefa = self._tarefas.get(id_tarefa)
+        return bool(tarefa) and tarefa["futuro"].cancel()
+
+    def listar(self) -> List[Dict[str, Any]]:
+        """Lista as tarefas pendentes ou em execução"""
+        with self._lock:
+            return [
+                {"id": id_tarefa, "nome": t["nome"], "grupo": t["grupo"],
+                 "inicio": t["inicio"], "rodando": t["futuro"].running()}
+                for id_tarefa, t in self._tarefas.items()
+            ]
+
+    def ocupado(self, grupo: str) -> bool:
+        """Indica se há alguma tarefa do grupo em andamento"""
+        with self._lock:
+            return any(t["grupo"] == grupo for t in self._tarefas.values())
+
+    def encerrar(self):
+        """Descarta as tarefas na fila e libera o pool sem esperar as que já rodam"""
+        with self._lock:
+            futuros = [t["futuro"] for t in self._tarefas.values()]
+        # shutdown(cancel_futures=True) só existe a partir do Python 3.9
+        for futuro in futuros:
+            futuro.cancel()
+        self._pool.shutdown(wait=False)
+
+executor_bloqueante = ExecutorBloqueante()
+
+class CacheTTL:
+    """Cache em memória com TTL por chave; `forcar` ignora o valor guardado"""
+
+    def __init__(self, ttls: Dict[str, float] = TTLS_CACHE, ttl_padrao: float = TTL_CACHE_PADRAO):
+        self.ttls = dict(ttls)
+        self.ttl_padrao = ttl_padrao
+        self._dados: Dict[str, tuple] = {}
+
+    def _ttl(self, chave: str) -> float:
+        return self.ttls.get(chave.split(":", 1)[0], self.ttl_padrao)
+
+    def consultar(self, chave: str) -> Optional[tuple]:
+        """Retorna (valor, idade em segundos) se a entrada ainda for válida"""
+        entrada = self._dados.get(chave)
+        if entrada is None:
+            return None
+        valor, criado = entrada
+        idade = time.monotonic() - criado
+        if idade > self._ttl(chave):
+            self._dados.pop(chave, None)
+            return None
+        return valor, idade
+
+    def definir(self, chave: str, valor: Any):
+        self._dados[chave] = (valor, time.monotonic())
+
+    async def obter(self, chave: str, produtor, forcar: bool = False) -> tuple:
+        """Retorna (valor, idade); chama `produtor()` se expirado ou forçado.
+
+        Exceções do produtor não são armazenadas.
+        """
+        if not forcar:
+            em_cache = self.consultar(chave)
+            if em_cache is not None:
+                return em_cache
+        valor = await produtor()
+        self.definir(chave, valor)
+        return valor, 0.0
+
+cache_ttl = CacheTTL()
+
+class ColapsadorRequisicoes:
+    """Requisições idênticas simultâneas compartilham uma única execução"""
+
+    def __init__(self):
+        self._em_andamento: Dict[tuple, asyncio.Future] = {}
+
+    async def executar(self, chave: tuple, produtor):
+        """Aguarda a execução em andamento de `chave` ou inicia `produtor()`"""
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(produtor())
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda _: self._em_andamento.pop(chave, None))
+        # shield: um chamador cancelado não cancela o resultado dos demais
+        return await asyncio.shield(tarefa)
+
+colapsador = ColapsadorRequisicoes()
+
+def coalescer(func):
+    """Decorador: chamadas concorrentes com os mesmos argumentos viram uma só"""
+    @functools.wraps(func)
+    async def envoltorio(*args, **kwargs):
+        chave = (func.__name__, args, tuple(sorted(kwargs.items())))
+        return await colapsador.executar(chave, lambda: func(*args, **kwargs))
+    return envoltorio
+
+def formatar_idade(segundos: float) -> str:
+    """Descreve a idade de um dado em cache"""
+    if segundos < 1:
+        return "agora"
+    if segundos < 60:
+        return f"há {segundos:.0f}s"
+    if segundos < 3600:
+        return f"há {segundos // 60:.0f}min"
+    return f"há {segundos // 3600:.0f}h"
+
+def formatar_taxa(bytes_por_segundo: float) -> str:
+    """Formata uma taxa em bytes/s com unidade legível"""
+    for unidade in ("B/s", "KB/s", "MB/s", "GB/s"):
+        if bytes_por_segundo < 1024 or unidade == "GB/s":
+            return f"{bytes_por_segundo:.1f} {unidade}"
+        bytes_por_segundo /= 1024
+
+_CARACTERES_MARKDOWN = "\\_*[]()~`>#+-=|{}.!"
+_CONJUNTO_MARKDOWN = frozenset(_CARACTERES_MARKDOWN)
+# O texto fixo dos modelos mantém *negrito* e `código`
+_TABELA_MODELO = str.maketrans({c: "\\" + c for c in _CARACTERES_MARKDOWN if c not in "*`"})
+_formatador = string.Formatter()
+
 def escape_markdown(text: str) -> str:
-    """Escapa caracteres especiais para Markdown V2"""
+    """Escapa caracteres especiais para Markdown V2.
+
+    Textos sem caracteres especiais voltam sem cópia, e só os caracteres
+    presentes geram um replace. No CPython isso é mais rápido que
+    str.translate ou re.sub (ver benchmark_markdown.py).
+    """
     if not isinstance(text, str):
-        return str(text)
-    chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in chars:
-        text = text.replace(char, f"\\{char}")
+        text = str(text)
+    if _CONJUNTO_MARKDOWN.isdisjoint(text):
+        return text
+    for char in _CARACTERES_MARKDOWN:
+        if char in text:
+            text = text.replace(char, "\\" + char)
     return text
 
+@functools.lru_cache(maxsize=512)
+def _compilar_modelo(modelo: str) -> tuple:
+    """Divide o modelo em (texto fixo já escapado, campo, formato, conversão)"""
+    return tuple(
+        (literal.translate(_TABELA_MODELO), campo, formato, conversao)
+        for literal, campo, formato, conversao in _formatador.parse(modelo)
+    )
+
+def md(modelo: str, *args, **kwargs) -> str:
+    """Renderiza um modelo Markdown V2 no estilo str.format.
+
+    Só os valores interpolados são escapados por completo; o texto fixo
+    do modelo preserva a formatação *negrito* e `código`.
+    """
+    partes = []
+    posicao = 0
+    for literal, campo, formato, conversao in _compilar_modelo(modelo):
+        partes.append(literal)
+        if campo is None:
+            continue
+        if campo == "":
+            valor = args[posicao]
+            posicao += 1
+        elif campo.isdigit():
+            valor = args[int(campo)]
+        else:
+            valor = kwargs[campo]
+        if conversao == "r":
+            valor = repr(valor)
+        elif conversao == "s":
+            valor = str(valor)
+        partes.append(escape_markdown(format(valor, formato or "")))
+    return "".join(partes)
+
+def escape_markdown_pre(text: str) -> str:
+    """Escapa texto para dentro de um bloco ``` em Markdown V2"""
+    return text.replace("\\", "\\\\").replace("`", "\\`")
+
+def _corte_seguro(linha: str, limite: int) -> int:
+    """Maior posição <= limite que não separa uma barra do caractere escapado"""
+    corte = limite
+    barras = 0
+    while corte - barras - 1 >= 0 and linha[corte - barras - 1] == "\\":
+        barras += 1
+    return corte - 1 if barras % 2 else corte
+
+def paginar(texto: str, limite: int = LIMITE_MENSAGEM - RESERVA_RODAPE_PAGINA) -> List[str]:
+    """Divide um texto Markdown V2 já renderizado em páginas de até `limite`.
+
+    As quebras acontecem em fins de linha; blocos ``` abertos são fechados
+    no fim da página e reabertos na seguinte, e linhas maiores que o
+    limite são cortadas sem separar escapes.
+    """
+    if len(texto) <= limite:
+        return [texto]
+    
+    paginas = []
+    atual: List[str] = []
+    tamanho = 0
+    em_bloco = False
+    
+    def fechar_pagina():
+        nonlocal atual, tamanho
+        conteudo = "\n".join(atual)
+        if em_bloco:
+            conteudo += "\n```"
+        paginas.append(conteudo)
+        atual = ["```"] if em_bloco else []
+        tamanho = len(atual[0]) + 1 if atual else 0
+    
+    for linha in texto.split("\n"):
+        # Espaço reservado para fechar um bloco ``` no fim da página
+        disponivel = limite - 4
+        while tamanho + len(linha) + 1 > disponivel:
+            livre = disponivel - tamanho - 1
+            if livre < 1 and atual:
+                fechar_pagina()
+                continue
+            corte = _corte_seguro(linha, max(livre, 1))
+            atual.append(linha[:corte])
+            linha = linha[corte:]
+            fechar_pagina()
+        atual.append(linha)
+        tamanho += len(linha) + 1
+        if linha.startswith("```"):
+            em_bloco = not em_bloco
+    if atual and any(atual):
+        paginas.append("\n".join(atual))
+    return paginas
+
+class CachePaginas:
+    """LRU limitado com as páginas de cada mensagem, chaveado por (chat, mensagem)"""
+
+    def __init__(self, capacidade: int = MAX_MENSAGENS_PAGINADAS):
+        self.capacidade = capacidade
+        self._dados: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def guardar(self, chave: tuple, paginas: List[str], teclado: Optional[InlineKeyboardMarkup]):
+        self._dados[chave] = (paginas, teclado)
+        self._dados.move_to_end(chave)
+        while len(self._dados) > self.capacidade:
+            self._dados.popitem(last=False)
+
+    def obter(self, chave: tuple) -> Optional[tuple]:
+        entrada = self._dados.get(chave)
+        if entrada is not None:
+            self._dados.move_to_end(chave)
+        return entrada
+
+cache_paginas = CachePaginas()
+
+def montar_pagina(paginas: List[str], indice: int, teclado: Optional[InlineKeyboardMarkup]) -> tuple:
+    """Retorna (texto, teclado) da página com os botões ◀️/▶️"""
+    total = len(paginas)
+    texto = paginas[indice] + md("\n\n📄 Página {}/{}", indice + 1, total)
+    navegacao = []
+    if indice > 0:
+        navegacao.append(InlineKeyboardButton("◀️", callback_data=f"pag:{indice - 1}"))
+    navegacao.append(InlineKeyboardButton(f"{indice + 1}/{total}", callback_data="pag"))
+    if indice < total - 1:
+        navegacao.append(InlineKeyboardButton("▶️", callback_data=f"pag:{indice + 1}"))
+    linhas = [navegacao] + (list(teclado.inline_keyboard) if teclado else [])
+    return texto, InlineKeyboardMarkup(linhas)
+
+# Nunca enviados pelo /get: o config.json tem o token do bot e o da frota
+ARQUIVOS_PROTEGIDOS = frozenset({os.path.realpath("config.json")})
+
+class ComandoNegado(Exception):
+    """O comando não passou pela política de comandos"""
+
+class PoliticaComandos:
+    r"""Listas de comandos permitidos/bloqueados compiladas em conjuntos.
+
+    `analisar` valida o programa de cada segmento de um pipeline (pelo nome
+    base, então /bin/rm conta como rm) e diz se o comando pode ser
+    executado direto com exec, sem passar por /bin/sh.
+
+    >>> politica = PoliticaComandos(["ls", "echo"], ["rm"])
+    >>> politica.analisar("ls a#b; id")
+    Traceback (most recent call last):
+    telegram_terminal_bot.ComandoNegado: 'id' não está na lista de permitidos
+    >>> politica.analisar("ls #\nid")
+    Traceback (most recent call last):
+    telegram_terminal_bot.ComandoNegado: comentários (#) não são permitidos
+    >>> politica.analisar("echo 'a #b' \\#c a#b") is None  # aceito, via shell
+    True
+    """
+
+    OPERADORES = frozenset({"|", "||", "&&", ";", "&", "|&", ";;", "(", ")"})
+    # Substituições escondem comandos que a política não consegue ver
+    PROIBIDOS = ("$(", "`", "<(", ">(")
+    METACARACTERES = frozenset("|&;<>()$`\\*?[]{}~!#\n")
+    # Caracteres depois dos quais um # sem aspas inicia um comentário no sh
+    INICIO_PALAVRA = frozenset(" \t\n;&|()<>")
+    ATRIBUICAO = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*\+?=")
+    # Variáveis que o bash executa ou que mudam o programa executado/o prompt
+    VARIAVEIS_PROTEGIDAS = frozenset({
+        "PROMPT_COMMAND", "PS0", "PS1", "PS2", "PS4", "BASH_ENV", "ENV", "PATH",
+        "LD_PRELOAD", "LD_LIBRARY_PATH"
+    })
+    DEFINEM_VARIAVEIS = frozenset({"export", "unset", "declare", "typeset", "readonly", "local"})
+
+    def __init__(self, permitidos: List[str], bloqueados: List[str], redirecionar_saida: bool = False,
+                 diretorios_leitura: List[str] = ()):
+        self.permitidos = frozenset(permitidos)
+        self.bloqueados = frozenset(bloqueados)
+        self.redirecionar_saida = redirecionar_saida
+        self.diretorios_leitura = tuple(os.path.realpath(d) for d in diretorios_leitura)
+
+    @classmethod
+    def _tem_comentario(cls, comando: str) -> bool:
+        """Há um # sem aspas no início de uma palavra (o sh ignoraria o resto da linha)?"""
+        aspas = None
+        escapado = False
+        anterior = " "
+        for caractere in comando:
+            if escapado:
+                escapado = False
+            elif caractere == "\\" and aspas != "'":
+                escapado = True
+            elif aspas:
+                if caractere == aspas:
+                    aspas = None
+            elif caractere in "'\"":
+                aspas = caractere
+            elif caractere == "#" and anterior in cls.INICIO_PALAVRA:
+                return True
+            anterior = caractere
+        return False
+
+    def _verificar_programa(self, programa: str, extras: frozenset):
+        nome = os.path.basename(programa)
+        if nome in self.bloqueados:
+            raise ComandoNegado(f"'{nome}' está bloqueado")
+        if self.permitidos and nome not in self.permitidos and nome not in extras:
+            raise ComandoNegado(f"'{nome}' não está na lista de permitidos")
+
+    def verificar_leitura(self, caminho: str):
+        """Valida o download de `caminho` (já resolvido com realpath) pelo /get.
+
+        Com `diretorios_leitura` configurado, só arquivos dentro deles são
+        aceitos; sem ele, baixar equivale a `cat <caminho>` para a política.
+        """
+        if caminho in ARQUIVOS_PROTEGIDOS:
+            raise ComandoNegado("este arquivo contém credenciais do bot")
+        if self.diretorios_leitura:
+            if not any(os.path.commonpath([caminho, d]) == d for d in self.diretorios_leitura):
+                raise ComandoNegado("fora dos diretórios liberados para download")
+        else:
+            self._verificar_programa("cat", frozenset())
+
+    def _verificar_redirecionamento(self, operador: str, alvo: str):
+        # Redirecionar a saída grava arquivos mesmo com programas só de leitura
+        if self.redirecionar_saida or not (">" in operador or operador == "<>"):
+            return
+        if alvo == "/dev/null" or (operador == ">&" and (alvo.isdigit() or alvo == "-")):
+            return
+        raise ComandoNegado(f"redirecionamento de saída para '{alvo}' não é permitido")
+
+    def _verificar_variavel(self, token: str):
+        nome = token.partition("=")[0].rstrip("+")
+        if nome in self.VARIAVEIS_PROTEGIDAS:
+            raise ComandoNegado(f"a variável {nome} não pode ser alterada")
+
+    def analisar(self, comando: str, extras: frozenset = frozenset()) -> Optional[List[str]]:
+        """Valida o comando e retorna o argv para exec direto, ou None se precisar de shell.
+
+        `extras` são programas aceitos além da lista de permitidos. Lança
+        ComandoNegado se algum programa não for permitido.
+        """
+        if any(proibido in comando for proibido in self.PROIBIDOS):
+            raise ComandoNegado("substituição de comandos não é permitida")
+        # Um comentário esconderia do shlex o que vem depois dele
+        if self._tem_comentario(comando):
+            raise ComandoNegado("comentários (#) não são permitidos")
+        try:
+            # Para o shell, quebra de linha separa comandos como ";"
+            lexer = shlex.shlex(comando.replace("\n", " ; "), posix=True, punctuation_chars=True)
+            lexer.commenters = ""
+            lexer.whitespace_split = True
+            tokens = list(lexer)
+        except ValueError as e:
+            raise ComandoNegado(f"comando mal formado: {e}")
+        if not tokens:
+            raise ComandoNegado("comando vazio")
+        
+        inicio_segmento = True
+        redirecionamento = None
+        programa = None
+        for token in tokens:
+            if redirecionamento:
+                self._verificar_redirecionamento(redirecionamento, token)
+                redirecionamento = None
+            elif token in self.OPERADORES:
+                inicio_segmento = True
+                programa = None
+            elif token[0] in "<>" or token in ("&>", ">&", "&>>"):
+                # O próximo token é o arquivo do redirecionamento
+                redirecionamento = token
+            elif inicio_segmento and self.ATRIBUICAO.match(token):
+                self._verificar_variavel(token)
+            elif inicio_segmento:
+                self._verificar_programa(token, extras)
+                programa = os.path.basename(token)
+                inicio_segmento = False
+            elif programa in self.DEFINEM_VARIAVEIS:
+                self._verificar_variavel(token)
+        
+        if self.METACARACTERES.isdisjoint(comando) and not self.ATRIBUICAO.match(tokens[0]):
+            return tokens
+        return None
+
+class ControleAcesso:
+    """Autorização por conjuntos, recarregada do config.json quando o arquivo muda.
+
+    O arquivo é verificado por stat (mtime, tamanho e inode) no máximo a
+    cada INTERVALO_RECARGA_CONFIG; a nova configuração substitui a anterior
+    de uma vez e, se o JSON estiver inválido, a anterior continua valendo.
+    Quem falha mais de `tentativas_maximas` vezes em JANELA_TENTATIVAS fica
+    DURACAO_BLOQUEIO segundos sendo ignorado sem resposta.
+    """
+
+    def __init__(self, caminho: str = "config.json", config: Optional[Dict[str, Any]] = None):
+        self.caminho = caminho
+        self._assinatura = self._assinar()
+        self._assinatura_invalida: Optional[tuple] = None
+        self._proxima_verificacao = time.monotonic() + INTERVALO_RECARGA_CONFIG
+        self._estado = self._montar_estado(CONFIG if config is None else config)
+        self._falhas: "OrderedDict[int, list]" = OrderedDict()
+        self._bloqueados_ate: "OrderedDict[int, float]" = OrderedDict()
+
+    def _assinar(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.caminho)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    @staticmethod
+    def _montar_estado(config: Dict[str, Any]) -> Dict[str, Any]:
+        autorizados = [int(i) for i in config.get("ids_autorizados", [])]
+        bloqueados = [str(b).strip().lower().lstrip("@") for b in config.get("usuarios_bloqueados", [])]
+        return {
+            "dono": str(config.get("dono_username", "")).lower().lstrip("@"),
+            "ids": frozenset(autorizados),
+            "ids_alertas": tuple(int(i) for i in config.get("ids_alertas") or autorizados),
+            "bloqueados_ids": frozenset(int(b) for b in bloqueados if b.lstrip("-").isdigit()),
+            "bloqueados_nomes": frozenset(b for b in bloqueados if b and not b.lstrip("-").isdigit()),
+            "tentativas_maximas": int(config.get("tentativas_maximas", 3)),
+            "politica": PoliticaComandos(
+                config.get("comandos_permitidos", []), config.get("comandos_bloqueados", []),
+                bool(config.get("permitir_redirecionamento_saida", False)),
+                config.get("diretorios_download", [])
+            )
+        }
+
+    def recarregar(self, forcar: bool = False):
+        """Relê o config.json se ele mudou desde a última leitura"""
+        agora = time.monotonic()
+        if not forcar and agora < self._proxima_verificacao:
+            return
+        self._proxima_verificacao = agora + INTERVALO_RECARGA_CONFIG
+        assinatura = self._assinar()
+        if assinatura is None or assinatura in (self._assinatura, self._assinatura_invalida):
+            return
+        try:
+            with open(self.caminho, 'r') as f:
+                estado = self._montar_estado(json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            # Uma gravação em andamento muda a assinatura de novo ao terminar
+            self._assinatura_invalida = assinatura
+            logger.warning(f"Configuração inválida, mantendo a anterior: {e}")
+            return
+        self._estado = estado
+        self._assinatura = assinatura
+        logger.info(f"Configuração recarregada: {len(estado['ids'])} usuário(s) autorizado(s)")
+
+    @property
+    def ids_alertas(self) -> tuple:
+        self.recarregar()
+        return self._estado["ids_alertas"]
+
+    @property
+    def politica(self) -> PoliticaComandos:
+        self.recarregar()
+        return self._estado["politica"]
+
+    def verificar(self, usuario) -> Optional[bool]:
+        """True se autorizado, False se negado (responder) e None se deve ser ignorado"""
+        self.recarregar()
+        estado = self._estado
+        nome = (usuario.username or "").lower()
+        if usuario.id in estado["bloqueados_ids"] or nome in estado["bloqueados_nomes"]:
+            return None
+        if usuario.id in estado["ids"] or (nome and nome == estado["dono"]):
+            return True
+        
+        agora = time.monotonic()
+        ate = self._bloqueados_ate.get(usuario.id)
+        if ate is not None:
+            if agora < ate:
+                return None
+            del self._bloqueados_ate[usuario.id]
+        
+        registro = self._falhas.pop(usuario.id, None)
+        if registro is None or agora - registro[1] > JANELA_TENTATIVAS:
+            registro = [0, agora]
+        registro[0] += 1
+        if registro[0] > estado["tentativas_maximas"]:
+            self._bloqueados_ate[usuario.id] = agora + DURACAO_BLOQUEIO
+            while len(self._bloqueados_ate) > MAX_REGISTROS_ACESSO:
+                self._bloqueados_ate.popitem(last=False)
+            logger.warning(f"Usuário {usuario.id} (@{usuario.username}) bloqueado após {registro[0] - 1} tentativas")
+            return None
+        self._falhas[usuario.id] = registro
+        while len(self._falhas) > MAX_REGISTROS_ACESSO:
+            self._falhas.popitem(last=False)
+        logger.info(f"Acesso negado para {usuario.id} (@{usuario.username}), tentativa {registro[0]}")
+        return False
+
+controle_acesso = ControleAcesso()
+
 async def verificar_autorizacao(update: Update) -> bool:
-    """Verifica se o usuário está autorizado"""
+    """Verifica se o usuário está autorizado; bloqueados são ignorados sem resposta"""
     user = update.effective_user
-    if user.username and user.username.lower() == DONO_USERNAME or user.id in IDS_AUTORIZADOS:
+    if user is None:
+        return False
+    resultado = controle_acesso.verificar(user)
+    if resultado:
         return True
-    await update.message.reply_text(
-        escape_markdown("🚫 *Acesso Negado*\nVocê não está autorizado a usar este bot.\nEntre em contato com o administrador."),
-        parse_mode=ParseMode.MARKDOWN_V2
-    )
+    if resultado is None:
+        return False
+    
+    if update.callback_query:
+        await update.callback_query.answer("🚫 Acesso negado", show_alert=True)
+    elif update.effective_message:
+        await update.effective_message.reply_text(
+            md("🚫 *Acesso Negado*\nVocê não está autorizado a usar este bot.\nEntre em contato com o administrador."),
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
     return False
 
-async def executar_comando(comando: str, timeout: int = 30) -> str:
+def _prefixo_prioridade(baixa_prioridade: Optional[bool]) -> List[str]:
+    """Prefixo de argv com nice e ionice idle.
+
+    Reduzir a prioridade por argv evita rodar Python no filho entre fork e
+    exec (preexec_fn), o que pode travar com as threads do bot.
+    """
+    if baixa_prioridade is None:
+        baixa_prioridade = COMANDOS_BAIXA_PRIORIDADE
+    return PREFIXO_BAIXA_PRIORIDADE if baixa_prioridade else []
+
+async def _criar_processo(comando: str, argv: Optional[List[str]] = None,
+                          baixa_prioridade: Optional[bool] = None, **opcoes) -> asyncio.subprocess.Process:
+    """Inicia `argv` (ou o comando via /bin/sh) com a prioridade configurada"""
+    argv = argv or ["/bin/sh", "-c", comando]
+    return await asyncio.create_subprocess_exec(*_prefixo_prioridade(baixa_prioridade), *argv, **opcoes)
+
+async def executar_comando(comando: str, timeout: int = TIMEOUT_COMANDO, baixa_prioridade: Optional[bool] = None) -> str:
     """Executa um comando com timeout"""
     try:
-        processo = await asyncio.create_subprocess_shell(
-            comando,
+        processo = await _criar_processo(
+            comando, baixa_prioridade=baixa_prioridade,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
         )
         
         try:
@@ -105,395 +1376,2705 @@ async def executar_comando(comando: str, timeout: int = 30) -> str:
             else:
                 return f"❌ Erro:\n{stderr.decode('utf-8', errors='replace')}"
         except asyncio.TimeoutError:
-            try:
-                processo.kill()
-            except:
-                pass
+            _encerrar_grupo(processo)
             return "⚠️ Comando excedeu o tempo limite"
+        except asyncio.CancelledError:
+            _encerrar_grupo(processo)
+            raise
             
     except Exception as e:
         return f"❌ Erro ao executar comando: {e}"
 
-async def obter_status_sistema() -> str:
-    """Obtém status detalhado do sistema"""
-    try:
-        cpu_percent = psutil.cpu_percent(interval=1)
-        cpu_freq = psutil.cpu_freq()
-        cpu_count = psutil.cpu_count()
-        mem = psutil.virtual_memory()
-        swap = psutil.swap_memory()
-        disk = psutil.disk_usage('/')
-        uptime = datetime.now() - datetime.fromtimestamp(psutil.boot_time())
-        
-        status = (
-            "🖥️ *Status do Sistema*\n\n"
-            f"📊 *CPU*:\n"
-            f"  • Uso: {cpu_percent}%\n"
-            f"  • Frequência: {cpu_freq.current:.1f} MHz\n"
-            f"  • Núcleos: {cpu_count}\n\n"
-            f"🧠 *Memória*:\n"
-            f"  • RAM Total: {mem.total/1024/1024/1024:.1f} GB\n"
-            f"  • RAM Usada: {mem.used/1024/1024/1024:.1f} GB ({mem.percent}%)\n"
-            f"  • Swap Usada: {swap.used/1024/1024/1024:.1f} GB ({swap.percent}%)\n\n"
-            f"💾 *Disco*:\n"
-            f"  • Total: {disk.total/1024/1024/1024:.1f} GB\n"
-            f"  • Usado: {disk.used/1024/1024/1024:.1f} GB ({disk.percent}%)\n"
-            f"  • Livre: {disk.free/1024/1024/1024:.1f} GB\n\n"
-            f"⏰ *Uptime*: {uptime.days}d {uptime.seconds//3600}h {(uptime.seconds//60)%60}m"
-        )
-        
-        return escape_markdown(status)
-    except Exception as e:
-        return escape_markdown(f"❌ Erro ao obter status: {e}")
+class SaidaLimitada:
+    """Mantém só a cauda da saída em memória; a saída vai para disco até `limite_arquivo` bytes"""
 
-async def obter_processos(limite: int = 10) -> str:
-    """Obtém lista dos processos mais ativos"""
+    def __init__(self, limite_cauda: int = LIMITE_CAUDA_SAIDA * 4, limite_arquivo: int = MAX_SAIDA_ARQUIVO):
+        self.limite_cauda = limite_cauda
+        self.limite_arquivo = limite_arquivo
+        self.total = 0
+        self.gravados = 0
+        self._cauda = bytearray()
+        self.arquivo = tempfile.TemporaryFile(prefix="bot-saida-")
+
+    def escrever(self, dados: bytes):
+        if self.gravados < self.limite_arquivo:
+            parte = dados[:self.limite_arquivo - self.gravados]
+            self.arquivo.write(parte)
+            self.gravados += len(parte)
+        self.total += len(dados)
+        self._cauda += dados
+        excesso = len(self._cauda) - self.limite_cauda
+        if excesso > 0:
+            del self._cauda[:excesso]
+
+    def cauda(self, caracteres: int = LIMITE_CAUDA_SAIDA) -> str:
+        texto = self._cauda.decode('utf-8', errors='replace')
+        return texto[-caracteres:]
+
+    @property
+    def truncada(self) -> bool:
+        """A saída não cabe inteira na mensagem"""
+        return self.total > LIMITE_CAUDA_SAIDA
+
+    @property
+    def arquivo_cortado(self) -> bool:
+        """A saída passou de `limite_arquivo` e o arquivo só tem o começo"""
+        return self.total > self.gravados
+
+    def descrever_anexo(self) -> str:
+        if self.arquivo_cortado:
+            return f"📎 Primeiros {self.gravados} de {self.total} bytes da saída enviados como arquivo"
+        return f"📎 Saída completa ({self.total} bytes) enviada como arquivo"
+
+    def fechar(self):
+        self.arquivo.close()
+
+def _renderizar_saida(comando: str, saida: SaidaLimitada, rodape: str) -> str:
+    """Monta a mensagem com cabeçalho, cauda da saída e rodapé"""
+    cabecalho = md("💻 *Comando*: `{}`", comando[:200])
+    rodape = escape_markdown(rodape)
+    folga = LIMITE_MENSAGEM - len(cabecalho) - len(rodape) - 16
+    bruto = saida.cauda().rstrip("\n")
+    cauda = escape_markdown_pre(bruto)
+    if len(cauda) > folga:
+        # Corta no texto original para nunca separar uma barra do seu escape
+        excesso, corte = len(cauda) - folga, 0
+        while excesso > 0:
+            excesso -= 2 if bruto[corte] in "\\`" else 1
+            corte += 1
+        cauda = escape_markdown_pre(bruto[corte:])
+    if not cauda.strip():
+        return f"{cabecalho}\n\n{rodape}"
+    return f"{cabecalho}\n```\n{cauda}\n```\n{rodape}"
+
+async def _editar_mensagem(mensagem: Message, texto: str, teclado: Optional[InlineKeyboardMarkup] = None) -> bool:
+    """Edita a mensagem ignorando 'not modified' e respeitando flood control"""
     try:
-        processos = []
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'status', 'username']):
-            try:
-                pinfo = proc.info
-                pinfo['cpu_percent'] = proc.cpu_percent()
-                processos.append(pinfo)
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                pass
-        
-        processos.sort(key=lambda x: x['cpu_percent'], reverse=True)
-        
-        texto = "🔄 *Top Processos*\n\n"
-        for proc in processos[:limite]:
-            texto += (
-                f"📌 *{proc['name'][:20]}*\n"
-                f"  • PID: `{proc['pid']}`\n"
-                f"  • CPU: {proc['cpu_percent']:.1f}%\n"
-                f"  • RAM: {proc['memory_percent']:.1f}%\n"
-                f"  • Status: {proc['status']}\n"
-                f"  • Usuário: {proc['username']}\n\n"
-            )
-        
-        return escape_markdown(texto)
-    except Exception as e:
-        return escape_markdown(f"❌ Erro ao listar processos: {e}")
+        await mensagem.edit_text(texto, reply_markup=teclado, parse_mode=ParseMode.MARKDOWN_V2)
+        return True
+    except RetryAfter as e:
+        logger.warning(f"Limite de edições atingido, aguardando {e.retry_after}s")
+        await asyncio.sleep(e.retry_after)
+    except TelegramError as e:
+        if "not modified" not in str(e).lower():
+            logger.warning(f"Erro ao editar mensagem: {e}")
+    return False
 
-async def obter_info_rede() -> str:
-    """Obtém informações detalhadas da rede"""
+def _encerrar_grupo(processo: asyncio.subprocess.Process):
+    """Mata o processo e seus filhos (o shell roda em uma nova sessão)"""
     try:
-        interfaces = psutil.net_if_stats()
-        io_counters = psutil.net_io_counters(pernic=True)
-        
-        texto = "🌐 *Informações de Rede*\n\n"
-        
+        os.killpg(processo.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
         try:
-            response = requests.get('https://api.ipify.org?format=json')
-            ip_publico = response.json()['ip']
-            texto += f"🌍 *IP Público*: `{ip_publico}`\n\n"
-        except:
+            processo.kill()
+        except ProcessLookupError:
             pass
-        
-        texto += "📡 *Interfaces*:\n\n"
-        for nome, stats in interfaces.items():
-            if nome != 'lo':
-                io = io_counters.get(nome, None)
-                texto += (
-                    f"*{nome}*:\n"
-                    f"  • Status: {'🟢 Ativo' if stats.isup else '🔴 Inativo'}\n"
-                    f"  • Velocidade: {stats.speed} Mbps\n"
-                )
-                if io:
-                    texto += (
-                        f"  • Download: {io.bytes_recv/1024/1024:.1f} MB\n"
-                        f"  • Upload: {io.bytes_sent/1024/1024:.1f} MB\n"
-                    )
-                texto += "\n"
-        
-        conns = psutil.net_connections()
-        estabelecidas = len([c for c in conns if c.status == 'ESTABLISHED'])
-        listening = len([c for c in conns if c.status == 'LISTEN'])
-        
-        texto += (
-            "🔌 *Conexões*:\n"
-            f"  • Estabelecidas: {estabelecidas}\n"
-            f"  • Escutando: {listening}\n"
+
+class _Compressor:
+    """Interface comum para compressão em fluxo (gzip sempre, zstd se instalado)"""
+
+    def __init__(self, formato: Optional[str]):
+        self.formato = formato
+        if formato == "gz":
+            self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+            self.comprimir, self.finalizar = self._obj.compress, self._obj.flush
+        elif formato == "zst":
+            self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+            self.comprimir, self.finalizar = self._obj.compress, self._obj.flush
+        else:
+            self.comprimir, self.finalizar = bytes, bytes
+
+def _preparar_parte(origem, compressor: _Compressor, limite: int = TAMANHO_PARTE_ENVIO) -> tuple:
+    """Lê da origem até encher uma parte em disco; retorna (arquivo, tamanho da parte, acabou)"""
+    parte = tempfile.TemporaryFile(prefix="bot-parte-")
+    acabou = False
+    while parte.tell() < limite:
+        # Sem compressão a parte fecha no byte exato; com compressão, o bloco
+        # comprimido pode passar um pouco do limite (há folga até os 50 MB)
+        restante = limite - parte.tell()
+        bloco = origem.read(TAMANHO_BLOCO_ENVIO if compressor.formato else min(TAMANHO_BLOCO_ENVIO, restante))
+        if not bloco:
+            parte.write(compressor.finalizar())
+            acabou = True
+            break
+        parte.write(compressor.comprimir(bloco))
+    tamanho = parte.tell()
+    parte.seek(0)
+    return parte, tamanho, acabou
+
+async def enviar_arquivo_em_partes(mensagem: Message, origem, nome: str, compressao: Optional[str] = None,
+                                   tamanho: Optional[int] = None) -> int:
+    """Envia `origem` (arquivo binário aberto) como documento(s), em partes numeradas se preciso.
+
+    A leitura e a compressão rodam no executor, uma parte por vez em um
+    arquivo temporário, então a memória fica limitada ao tamanho de uma parte
+    (o upload do Telegram carrega a parte inteira). Partes de um gzip/zstd
+    concatenadas formam o arquivo comprimido original. Retorna o número de partes.
+    """
+    if compressao == "zst" and zstandard is None:
+        raise ValueError("compressão zstd indisponível (instale o pacote zstandard)")
+    compressor = _Compressor(compressao)
+    nome += COMPRESSOES.get(compressao, "")
+    total_partes = math.ceil(tamanho / TAMANHO_PARTE_ENVIO) if tamanho and not compressao else None
+    
+    numero = 0
+    acabou = False
+    while not acabou:
+        parte, tamanho_parte, acabou = await executor_bloqueante.executar(
+            _preparar_parte, origem, compressor, TAMANHO_PARTE_ENVIO,
+            timeout=TIMEOUT_UPLOAD, grupo="transferencia", nome=f"envio {nome}", aguardar_fim=True
         )
-        
-        return escape_markdown(texto)
-    except Exception as e:
-        return escape_markdown(f"❌ Erro ao obter informações de rede: {e}")
+        with parte:
+            if not tamanho_parte:
+                # Arquivo com tamanho múltiplo exato da parte: nada sobrou
+                break
+            numero += 1
+            if numero == 1 and acabou:
+                await mensagem.reply_document(
+                    document=parte, filename=nome, read_timeout=TIMEOUT_UPLOAD, write_timeout=TIMEOUT_UPLOAD
+                )
+                return 1
+            legenda = f"Parte {numero}/{total_partes}" if total_partes else f"Parte {numero}"
+            await mensagem.reply_document(
+                document=parte, filename=f"{nome}.part{numero:03d}", caption=legenda,
+                read_timeout=TIMEOUT_UPLOAD, write_timeout=TIMEOUT_UPLOAD
+            )
+    await mensagem.reply_text(
+        md("📦 {} enviado em {} partes. Para juntar:\n`cat {}.part* > {}`", nome, numero, nome, nome),
+        parse_mode=ParseMode.MARKDOWN_V2
+    )
+    return numero
 
-def executar_speedtest() -> str:
-    """Executa um teste de velocidade"""
+async def _exportar_saida(mensagem: Message, saida: "SaidaLimitada"):
+    """Envia a saída completa do comando, comprimida se for grande"""
+    nome = "saida.txt"
+    if saida.arquivo_cortado:
+        saida.arquivo.write(f"\n[... saída cortada: {saida.total - saida.gravados} bytes omitidos ...]\n".encode())
+        nome = "saida-cortada.txt"
+    saida.arquivo.flush()
+    tamanho = saida.arquivo.tell()
+    saida.arquivo.seek(0)
+    compressao = "gz" if tamanho > LIMITE_COMPRIMIR_SAIDA else None
+    await enviar_arquivo_em_partes(mensagem, saida.arquivo, nome, compressao, tamanho)
+
+async def executar_comando_streaming(comando: str, mensagem: Message, timeout: Optional[int] = None,
+                                     baixa_prioridade: Optional[bool] = None,
+                                     argv: Optional[List[str]] = None) -> Optional[int]:
+    """Executa um comando mostrando a saída ao vivo na `mensagem`.
+
+    A mensagem é editada no máximo a cada INTERVALO_EDICAO segundos. Só a
+    cauda da saída fica em memória; se ela não couber na mensagem, a saída
+    completa é enviada como documento ao final. Com `argv`, o programa é
+    executado direto, sem /bin/sh. Retorna o código de saída (None em caso
+    de timeout).
+    """
+    timeout = timeout or TIMEOUT_COMANDO
+    saida = SaidaLimitada()
     try:
-        import speedtest
-        s = speedtest.Speedtest()
-        s.get_best_server()
-        s.download()
-        s.upload()
+        processo = await _criar_processo(
+            comando, argv, baixa_prioridade,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            stdin=asyncio.subprocess.DEVNULL,
+            start_new_session=True
+        )
         
-        resultado = s.results.dict()
-        download = resultado["download"] / 1_000_000
-        upload = resultado["upload"] / 1_000_000
-        ping = resultado["ping"]
-        servidor = resultado["server"]["sponsor"]
-        cidade = resultado["server"]["name"]
+        async def ler():
+            while True:
+                bloco = await processo.stdout.read(TAMANHO_BLOCO_LEITURA)
+                if not bloco:
+                    break
+                saida.escrever(bloco)
         
-        texto = (
-            "🚀 *Resultado do Speed Test*\n\n"
-            f"⬇️ *Download*: `{download:.2f} Mbps`\n"
-            f"⬆️ *Upload*: `{upload:.2f} Mbps`\n"
-            f"🔄 *Ping*: `{ping:.0f} ms`\n"
-            f"🌐 *Servidor*: `{servidor} ({cidade})`\n"
-        )
+        inicio = time.monotonic()
+        leitor = asyncio.create_task(ler())
+        ultimo_total = 0
+        codigo = None
+        try:
+            while not leitor.done():
+                restante = timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait({leitor}, timeout=min(INTERVALO_EDICAO, restante))
+                if not leitor.done() and saida.total != ultimo_total:
+                    ultimo_total = saida.total
+                    decorrido = time.monotonic() - inicio
+                    await _editar_mensagem(mensagem, _renderizar_saida(comando, saida, f"⏳ Executando... {decorrido:.0f}s"))
+            restante = max(timeout - (time.monotonic() - inicio), 0.1)
+            codigo = await asyncio.wait_for(processo.wait(), timeout=restante)
+            rodape = "✅ Concluído" if codigo == 0 else f"❌ Código de saída {codigo}"
+        except asyncio.TimeoutError:
+            _encerrar_grupo(processo)
+            leitor.cancel()
+            rodape = f"⚠️ Comando excedeu o tempo limite ({timeout}s)"
+        except asyncio.CancelledError:
+            _encerrar_grupo(processo)
+            leitor.cancel()
+            await _editar_mensagem(mensagem, _renderizar_saida(comando, saida, "🛑 Comando cancelado"))
+            raise
+        
+        if saida.truncada:
+            rodape += f"\n{saida.descrever_anexo()}"
+        await _editar_mensagem(mensagem, _renderizar_saida(comando, saida, rodape))
         
-        return escape_markdown(texto)
+        if saida.truncada:
+            await _exportar_saida(mensagem, saida)
+        return codigo
+    except FileNotFoundError:
+        await _editar_mensagem(mensagem, md("❌ Comando não encontrado: `{}`", argv[0] if argv else comando))
+        return None
     except Exception as e:
-        return escape_markdown(f"❌ Erro ao executar speedtest: {e}")
+        logger.error(f"Erro ao executar comando em streaming: {e}")
+        await _editar_mensagem(mensagem, escape_markdown(f"❌ Erro ao executar comando: {e}"))
+        return None
+    finally:
+        saida.fechar()
 
-def monitorar_sistema_thread(app: Application):
-    """Função que roda em uma thread separada para monitorar o sistema"""
-    logger.info("Iniciando monitoramento do sistema em thread separada")
-    
-    def enviar_alerta_sync(mensagem: str):
-        """Versão síncrona da função de enviar alerta"""
+class FilaCheia(Exception):
+    """O usuário já tem trabalhos demais na fila"""
+
+class TrabalhoComando:
+    """Um comando agendado por um usuário"""
+
+    def __init__(self, id_trabalho: int, usuario: int, descricao: str, fabrica):
+        self.id = id_trabalho
+        self.usuario = usuario
+        self.descricao = descricao
+        self.fabrica = fabrica
+        self.estado = "fila"
+        self.criado = time.time()
+        self.inicio: Optional[float] = None
+        self.tarefa: Optional[asyncio.Task] = None
+        self.resultado: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class AgendadorComandos:
+    """Limita comandos simultâneos e reveza a vez entre as filas de cada usuário"""
+
+    def __init__(self, max_concorrentes: int = MAX_COMANDOS_SIMULTANEOS, max_fila_usuario: int = MAX_FILA_USUARIO):
+        self.max_concorrentes = max_concorrentes
+        self.max_fila_usuario = max_fila_usuario
+        self._filas: "OrderedDict[int, deque]" = OrderedDict()
+        self._rodando: Dict[int, TrabalhoComando] = {}
+        self._ids = itertools.count(1)
+
+    def enviar(self, usuario: int, descricao: str, fabrica) -> TrabalhoComando:
+        """Enfileira `fabrica()` (uma corrotina) e retorna o trabalho criado"""
+        fila = self._filas.get(usuario)
+        pendentes = (len(fila) if fila else 0) + sum(1 for t in self._rodando.values() if t.usuario == usuario)
+        if pendentes >= self.max_fila_usuario:
+            raise FilaCheia(usuario)
+        trabalho = TrabalhoComando(next(self._ids), usuario, descricao, fabrica)
+        self._filas.setdefault(usuario, deque()).append(trabalho)
+        self._despachar()
+        return trabalho
+
+    async def executar(self, usuario: int, descricao: str, fabrica):
+        """Enfileira e aguarda o resultado do trabalho"""
+        return await self.enviar(usuario, descricao, fabrica).resultado
+
+    def _despachar(self):
+        # Round-robin: cada usuário com fila inicia um trabalho por vez
+        while len(self._rodando) < self.max_concorrentes and self._filas:
+            usuario, fila = next(iter(self._filas.items()))
+            trabalho = fila.popleft()
+            if fila:
+                self._filas.move_to_end(usuario)
+            else:
+                del self._filas[usuario]
+            trabalho.estado = "executando"
+            trabalho.inicio = time.time()
+            self._rodando[trabalho.id] = trabalho
+            trabalho.tarefa = asyncio.create_task(self._rodar(trabalho))
+
+    async def _rodar(self, trabalho: TrabalhoComando):
         try:
-            if IDS_AUTORIZADOS:
-                app.bot.send_message(
-                    chat_id=IDS_AUTORIZADOS[0],
-                    text=escape_markdown(mensagem),
-                    parse_mode=ParseMode.MARKDOWN_V2
-                )
+            resultado = await trabalho.fabrica()
+            trabalho.estado = "concluido"
+            if not trabalho.resultado.done():
+                trabalho.resultado.set_result(resultado)
+        except asyncio.CancelledError:
+            trabalho.estado = "cancelado"
+            if not trabalho.resultado.done():
+                trabalho.resultado.cancel()
         except Exception as e:
-            logger.error(f"Erro ao enviar alerta: {e}")
-    
-    while True:
-        try:
-            cpu_percent = psutil.cpu_percent(interval=1)
-            if cpu_percent > LIMITE_CPU and not alertas_enviados["cpu"]:
-                enviar_alerta_sync(f"⚠️ *Alerta de CPU*\n\nUso de CPU está em {cpu_percent}%!")
-                alertas_enviados["cpu"] = True
-            elif cpu_percent < LIMITE_CPU:
-                alertas_enviados["cpu"] = False
-            
-            mem = psutil.virtual_memory()
-            if mem.percent > LIMITE_RAM and not alertas_enviados["ram"]:
-                enviar_alerta_sync(f"⚠️ *Alerta de RAM*\n\nUso de RAM está em {mem.percent}%!")
-                alertas_enviados["ram"] = True
-            elif mem.percent < LIMITE_RAM:
-                alertas_enviados["ram"] = False
-            
-            disk = psutil.disk_usage('/')
-            if disk.percent > LIMITE_DISCO and not alertas_enviados["disco"]:
-                enviar_alerta_sync(f"⚠️ *Alerta de Disco*\n\nUso de disco está em {disk.percent}%!")
-                alertas_enviados["disco"] = True
-            elif disk.percent < LIMITE_DISCO:
-                alertas_enviados["disco"] = False
-            
-            time.sleep(INTERVALO_MONITORAMENTO)
-            
-        except Exception as e:
-            logger.error(f"Erro no monitoramento: {e}")
-            time.sleep(INTERVALO_MONITORAMENTO)
+            trabalho.estado = "erro"
+            logger.error(f"Erro no trabalho {trabalho.id}: {e}")
+            if not trabalho.resultado.done():
+                trabalho.resultado.set_exception(e)
+        finally:
+            self._rodando.pop(trabalho.id, None)
+            self._despachar()
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Comando /start - Menu principal"""
-    if not await verificar_autorizacao(update):
-        return
+    def cancelar(self, id_trabalho: int) -> bool:
+        """Cancela um trabalho na fila ou em execução"""
+        trabalho = self._rodando.get(id_trabalho)
+        if trabalho is not None:
+            trabalho.tarefa.cancel()
+            return True
+        for usuario, fila in list(self._filas.items()):
+            for trabalho in fila:
+                if trabalho.id == id_trabalho:
+                    fila.remove(trabalho)
+                    if not fila:
+                        del self._filas[usuario]
+                    trabalho.estado = "cancelado"
+                    trabalho.resultado.cancel()
+                    return True
+        return False
+
+    def listar(self) -> List[TrabalhoComando]:
+        """Trabalhos em execução seguidos dos que estão na fila"""
+        na_fila = [t for fila in self._filas.values() for t in fila]
+        return list(self._rodando.values()) + sorted(na_fila, key=lambda t: t.id)
+
+agendador_comandos = AgendadorComandos()
+
+class SessaoEncerrada(Exception):
+    """O shell da sessão terminou"""
+
+class SessaoShell:
+    """Um bash de longa duração em um PTY, com o fim de cada comando marcado pelo prompt.
+
+    O PS1 vira um marcador com um token aleatório e o código de saída ($?),
+    então cada comando custa uma escrita no PTY em vez de um novo shell, e
+    `cd`, variáveis e virtualenvs persistem entre comandos. O PTY é o
+    terminal de controle do bash, então um Ctrl-C interrompe só o comando
+    em primeiro plano.
+    """
+
+    def __init__(self, usuario: int):
+        self.usuario = usuario
+        self.criada = time.time()
+        self.ultimo_uso = time.monotonic()
+        self.ocupada = False
+        self.trava = asyncio.Lock()
+        self._token = secrets.token_hex(8)
+        self._marcador = re.compile(rb"__BOT_" + self._token.encode() + rb"_(\d+)__\n")
+        self._processo: Optional[asyncio.subprocess.Process] = None
+        self._mestre: Optional[int] = None
+        self._buffer = bytearray()
+        self._evento = asyncio.Event()
+        self.encerrada = False
+
+    async def iniciar(self):
+        mestre, escravo = pty.openpty()
+        atributos = termios.tcgetattr(escravo)
+        atributos[1] &= ~termios.ONLCR  # sem \r\n na saída
+        atributos[3] &= ~termios.ECHO   # sem eco da entrada
+        termios.tcsetattr(escravo, termios.TCSANOW, atributos)
+        
+        ambiente = dict(os.environ, TERM="dumb", PAGER="cat", GIT_PAGER="cat", SYSTEMD_PAGER="")
+        try:
+            # setsid -c: nova sessão com o PTY como terminal de controle (para o ^C)
+            self._processo = await asyncio.create_subprocess_exec(
+                "setsid", "-c", *_prefixo_prioridade(None),
+                "/bin/bash", "--noprofile", "--norc", "--noediting", "-i",
+                stdin=escravo, stdout=escravo, stderr=escravo,
+                env=ambiente, cwd=os.path.expanduser("~")
+            )
+        finally:
+            os.close(escravo)
+        self._mestre = mestre
+        os.set_blocking(mestre, False)
+        asyncio.get_running_loop().add_reader(mestre, self._ao_ler)
+        
+        self._escrever(f"PS1='__BOT_{self._token}_$?__\\n'; PS2=''; unset PROMPT_COMMAND; set +o history\n")
+        # Descarta o que veio antes do primeiro marcador (avisos de inicialização)
+        await asyncio.wait_for(self.executar(None, lambda dados: None), TIMEOUT_INICIO_SHELL)
+
+    def _ao_ler(self):
+        try:
+            dados = os.read(self._mestre, TAMANHO_BLOCO_LEITURA * 16)
+        except BlockingIOError:
+            return
+        except OSError:
+            dados = b""
+        if not dados:
+            # EIO: o bash terminou e fechou o terminal
+            self.encerrada = True
+            asyncio.get_running_loop().remove_reader(self._mestre)
+        self._buffer += dados
+        self._evento.set()
+
+    def _escrever(self, texto: str):
+        dados = texto.encode()
+        while dados:
+            try:
+                escrito = os.write(self._mestre, dados)
+            except BlockingIOError:
+                # Buffer do terminal cheio: o comando ainda não leu a entrada anterior
+                time.sleep(0.01)
+                continue
+            dados = dados[escrito:]
+
+    async def executar(self, comando: Optional[str], ao_receber) -> int:
+        """Envia `comando` e repassa a saída para `ao_receber(bytes)` até o próximo prompt.
+
+        Retorna o código de saída; lança SessaoEncerrada se o shell terminar.
+        """
+        self.ultimo_uso = time.monotonic()
+        if comando is not None:
+            self._escrever(comando.rstrip("\n") + "\n")
+        pendente = b""
+        # O marcador pode chegar partido entre duas leituras
+        reserva = len(self._token) + 24
+        while True:
+            await self._evento.wait()
+            self._evento.clear()
+            pendente += bytes(self._buffer)
+            self._buffer.clear()
+            m = self._marcador.search(pendente)
+            if m:
+                ao_receber(pendente[:m.start()])
+                resto = pendente[m.end():]
+                if resto:
+                    self._buffer[:0] = resto
+                    self._evento.set()
+                self.ultimo_uso = time.monotonic()
+                return int(m.group(1))
+            if self.encerrada:
+                ao_receber(pendente)
+                raise SessaoEncerrada()
+            if len(pendente) > reserva:
+                ao_receber(pendente[:-reserva])
+                pendente = pendente[-reserva:]
+
+    def interromper(self):
+        """Ctrl-C para o comando em primeiro plano"""
+        if not self.encerrada:
+            self._escrever("\x03")
+
+    async def encerrar(self):
+        if self._mestre is None:
+            return
+        if not self.encerrada:
+            asyncio.get_running_loop().remove_reader(self._mestre)
+            try:
+                self._escrever("exit\n")
+            except OSError:
+                pass
+        try:
+            await asyncio.wait_for(self._processo.wait(), 2)
+        except asyncio.TimeoutError:
+            _encerrar_grupo(self._processo)
+            await self._processo.wait()
+        os.close(self._mestre)
+        self._mestre = None
+        self.encerrada = True
+
+# Sessões ativas: usuário -> sessão
+SESSOES_SHELL: Dict[int, SessaoShell] = {}
+_recolhedor_sessoes: Optional[asyncio.Task] = None
+
+async def _recolher_sessoes():
+    """Encerra sessões ociosas há mais de TEMPO_OCIOSO_SHELL"""
+    while SESSOES_SHELL:
+        await asyncio.sleep(INTERVALO_RECOLHER_SHELL)
+        limite = time.monotonic() - TEMPO_OCIOSO_SHELL
+        for usuario, sessao in list(SESSOES_SHELL.items()):
+            if sessao.encerrada or (not sessao.ocupada and sessao.ultimo_uso < limite):
+                logger.info(f"Encerrando sessão de shell ociosa do usuário {usuario}")
+                SESSOES_SHELL.pop(usuario, None)
+                await sessao.encerrar()
+
+async def abrir_sessao(usuario: int) -> SessaoShell:
+    """Retorna a sessão do usuário, criando uma se necessário"""
+    global _recolhedor_sessoes
+    sessao = SESSOES_SHELL.get(usuario)
+    if sessao is not None and not sessao.encerrada:
+        return sessao
+    if len(SESSOES_SHELL) >= MAX_SESSOES_SHELL:
+        raise FilaCheia(usuario)
+    sessao = SessaoShell(usuario)
+    SESSOES_SHELL[usuario] = sessao
+    try:
+        await sessao.iniciar()
+    except BaseException:
+        SESSOES_SHELL.pop(usuario, None)
+        await sessao.encerrar()
+        raise
+    if _recolhedor_sessoes is None or _recolhedor_sessoes.done():
+        _recolhedor_sessoes = asyncio.create_task(_recolher_sessoes())
+    logger.info(f"Sessão de shell aberta para o usuário {usuario}")
+    return sessao
+
+async def fechar_sessao(usuario: int) -> bool:
+    sessao = SESSOES_SHELL.pop(usuario, None)
+    if sessao is None:
+        return False
+    await sessao.encerrar()
+    return True
+
+async def executar_na_sessao(sessao: SessaoShell, comando: str, mensagem: Message,
+                             timeout: Optional[int] = None) -> Optional[int]:
+    """Como executar_comando_streaming, mas dentro da sessão persistente do usuário"""
+    # Um comando por vez no PTY: o ^C de um timeout não pode atingir outro comando
+    async with sessao.trava:
+        timeout = timeout or TIMEOUT_COMANDO
+        saida = SaidaLimitada()
+        sessao.ocupada = True
+        tarefa = asyncio.ensure_future(sessao.executar(comando, saida.escrever))
+        inicio = time.monotonic()
+        ultimo_total = 0
+        codigo = None
+        try:
+            while not tarefa.done():
+                restante = timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait({tarefa}, timeout=min(INTERVALO_EDICAO, restante))
+                if not tarefa.done() and saida.total != ultimo_total:
+                    ultimo_total = saida.total
+                    decorrido = time.monotonic() - inicio
+                    await _editar_mensagem(mensagem, _renderizar_saida(comando, saida, f"⏳ Executando... {decorrido:.0f}s"))
+            codigo = tarefa.result()
+            rodape = "✅ Concluído" if codigo == 0 else f"❌ Código de saída {codigo}"
+        except asyncio.TimeoutError:
+            sessao.interromper()
+            rodape = f"⚠️ Comando excedeu o tempo limite ({timeout}s) e foi interrompido"
+        except asyncio.CancelledError:
+            sessao.interromper()
+            await _editar_mensagem(mensagem, _renderizar_saida(comando, saida, "🛑 Comando interrompido"))
+            raise
+        except SessaoEncerrada:
+            SESSOES_SHELL.pop(sessao.usuario, None)
+            await sessao.encerrar()
+            rodape = "🔚 Sessão encerrada"
+        finally:
+            if not tarefa.done():
+                # Depois do Ctrl-C, espera o prompt para a sessão voltar a um estado limpo
+                try:
+                    await asyncio.wait_for(asyncio.shield(tarefa), 2)
+                except (asyncio.TimeoutError, SessaoEncerrada):
+                    tarefa.cancel()
+            sessao.ocupada = False
     
-    keyboard = [
-        [
-            InlineKeyboardButton("💻 Sistema", callback_data=MENU_SISTEMA),
-            InlineKeyboardButton("👥 Usuários", callback_data=MENU_USUARIOS)
-        ],
-        [
-            InlineKeyboardButton("🔧 Serviços", callback_data=MENU_SERVICOS),
-            InlineKeyboardButton("🔒 Segurança", callback_data=MENU_SEGURANCA)
-        ],
-        [
-            InlineKeyboardButton("🌐 Rede", callback_data=MENU_REDE),
-            InlineKeyboardButton("📝 Logs", callback_data=MENU_LOGS)
-        ]
-    ]
+        try:
+            if saida.truncada:
+                rodape += f"\n{saida.descrever_anexo()}"
+            await _editar_mensagem(mensagem, _renderizar_saida(comando, saida, rodape))
+            if saida.truncada:
+                await _exportar_saida(mensagem, saida)
+            return codigo
+        finally:
+            saida.fechar()
+
+@coalescer
+async def obter_status_sistema() -> str:
+    """Obtém status detalhado do sistema"""
+    try:
+        amostra = await amostrador.snapshot_async()
+        if amostra is None:
+            return escape_markdown("⏳ Coletando métricas, tente novamente em instantes.")
+        cpu_percent = amostra["cpu_percent"]
+        cpu_freq = amostra["cpu_freq"]
+        cpu_count = amostra["cpu_count"]
+        mem = amostra["mem"]
+        swap = amostra["swap"]
+        disk = amostra["disk"]
+        uptime = datetime.now() - datetime.fromtimestamp(amostra["boot_time"])
+        freq_atual = cpu_freq.current if cpu_freq else 0.0
+        
+        status = md(
+            "🖥️ *Status do Sistema*\n\n"
+            "📊 *CPU*:\n"
+            "  • Uso: {}%\n"
+            "  • Frequência: {:.1f} MHz\n"
+            "  • Núcleos: {}\n\n"
+            "🧠 *Memória*:\n"
+            "  • RAM Total: {:.1f} GB\n"
+            "  • RAM Usada: {:.1f} GB ({}%)\n"
+            "  • Swap Usada: {:.1f} GB ({}%)\n\n"
+            "💾 *Disco*:\n"
+            "  • Total: {:.1f} GB\n"
+            "  • Usado: {:.1f} GB ({}%)\n"
+            "  • Livre: {:.1f} GB\n\n"
+            "⏰ *Uptime*: {}d {}h {}m",
+            cpu_percent, freq_atual, cpu_count,
+            mem.total / GB, mem.used / GB, mem.percent, swap.used / GB, swap.percent,
+            disk.total / GB, disk.used / GB, disk.percent, disk.free / GB,
+            uptime.days, uptime.seconds // 3600, (uptime.seconds // 60) % 60
+        )
+        
+        return status
+    except Exception as e:
+        return escape_markdown(f"❌ Erro ao obter status: {e}")
+
+@coalescer
+async def obter_processos(limite: int = 10, criterio: str = "cpu") -> str:
+    """Obtém lista dos processos mais ativos"""
+    try:
+        await tabela_processos.aguardar()
+        processos = tabela_processos.top(limite, criterio)
+        
+        texto = md("🔄 *Top Processos* ({})\n\n", CRITERIOS_PROCESSOS[criterio])
+        for proc in processos:
+            texto += md(
+                "📌 *{}*\n"
+                "  • PID: `{}`\n"
+                "  • CPU: {:.1f}%\n"
+                "  • RAM: {:.1f}%\n"
+                "  • I/O: {}\n"
+                "  • Status: {}\n"
+                "  • Usuário: {}\n\n",
+                proc.name[:20], proc.pid, proc.cpu_percent, proc.memory_percent,
+                formatar_taxa(proc.io_rate), proc.status, proc.username
+            )
+        texto += md("Total de processos: {}", len(tabela_processos))
+        
+        return texto
+    except Exception as e:
+        return escape_markdown(f"❌ Erro ao listar processos: {e}")
+
+class MedidorDiretorios:
+    """Mede o tamanho das subpastas de um diretório, como `du -x --max-depth=1`.
+
+    Vários threads consomem uma fila compartilhada de diretórios com
+    os.scandir (que libera o GIL durante a E/S), então uma única subpasta
+    enorme também é dividida entre eles. A varredura para ao estourar o
+    orçamento de tempo ou a profundidade e o resultado é marcado como parcial.
+    """
+
+    def __init__(self, trabalhadores: int = TRABALHADORES_DIRETORIOS,
+                 profundidade: int = PROFUNDIDADE_DIRETORIOS, orcamento: float = ORCAMENTO_DIRETORIOS):
+        self.trabalhadores = trabalhadores
+        self.profundidade = profundidade
+        self.orcamento = orcamento
+
+    def medir(self, raiz: str) -> Dict[str, Any]:
+        """Retorna {"itens": [(caminho, bytes)], "total", "parcial", "erros", "duracao"}"""
+        inicio = time.monotonic()
+        prazo = inicio + self.orcamento
+        dispositivo = os.stat(raiz).st_dev
+        nomes: List[str] = []
+        tamanhos: List[int] = []
+        arquivos_raiz = 0
+        # Hardlinks contam uma vez só, como no du (set.add é atômico sob o GIL)
+        vinculados = set()
+        fila: "queue.Queue" = queue.Queue()
+        
+        with os.scandir(raiz) as entradas:
+            for entrada in entradas:
+                try:
+                    st = entrada.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if entrada.is_dir(follow_symlinks=False) and st.st_dev == dispositivo:
+                    fila.put((entrada.path, len(nomes), 1))
+                    nomes.append(entrada.path)
+                    tamanhos.append(st.st_blocks * 512)
+                else:
+                    arquivos_raiz += st.st_blocks * 512
+        
+        estado = {"parcial": False, "erros": 0}
+        lock = threading.Lock()
+        
+        def trabalhador():
+            local: Dict[int, int] = {}
+            erros = 0
+            parcial = False
+            while True:
+                item = fila.get()
+                if item is None:
+                    fila.task_done()
+                    break
+                caminho, indice, nivel = item
+                try:
+                    if time.monotonic() > prazo:
+                        parcial = True
+                        continue
+                    soma = 0
+                    with os.scandir(caminho) as entradas:
+                        for entrada in entradas:
+                            try:
+                                st = entrada.stat(follow_symlinks=False)
+                            except OSError:
+                                erros += 1
+                                continue
+                            if st.st_nlink > 1 and not entrada.is_dir(follow_symlinks=False):
+                                if st.st_ino in vinculados:
+                                    continue
+                                vinculados.add(st.st_ino)
+                            soma += st.st_blocks * 512
+                            if entrada.is_dir(follow_symlinks=False) and st.st_dev == dispositivo:
+                                if nivel < self.profundidade:
+                                    fila.put((entrada.path, indice, nivel + 1))
+                                else:
+                                    parcial = True
+                    local[indice] = local.get(indice, 0) + soma
+                except OSError:
+                    erros += 1
+                finally:
+                    fila.task_done()
+            with lock:
+                for indice, soma in local.items():
+                    tamanhos[indice] += soma
+                estado["erros"] += erros
+                estado["parcial"] |= parcial
+        
+        threads = [threading.Thread(target=trabalhador, daemon=True) for _ in range(self.trabalhadores)]
+        for thread in threads:
+            thread.start()
+        fila.join()
+        for _ in threads:
+            fila.put(None)
+        for thread in threads:
+            thread.join()
+        
+        itens = heapq.nlargest(TOP_DIRETORIOS, zip(nomes, tamanhos), key=lambda item: item[1])
+        if arquivos_raiz:
+            itens.append((None, arquivos_raiz))
+        return {
+            "itens": itens,
+            "total": sum(tamanhos) + arquivos_raiz,
+            "parcial": estado["parcial"],
+            "erros": estado["erros"],
+            "duracao": time.monotonic() - inicio
+        }
+
+medidor_diretorios = MedidorDiretorios()
+
+# callback_data tem no máximo 64 bytes: caminhos viram um identificador curto
+_caminhos_callback: "OrderedDict[str, str]" = OrderedDict()
+
+def _id_caminho(caminho: str) -> str:
+    identificador = hashlib.blake2s(caminho.encode(), digest_size=6).hexdigest()
+    _caminhos_callback[identificador] = caminho
+    _caminhos_callback.move_to_end(identificador)
+    while len(_caminhos_callback) > MAX_CAMINHOS_CALLBACK:
+        _caminhos_callback.popitem(last=False)
+    return identificador
+
+def _barra(percentual: float, largura: int = 10) -> str:
+    cheios = round(min(max(percentual, 0), 100) / 100 * largura)
+    return "█" * cheios + "░" * (largura - cheios)
+
+@coalescer
+async def obter_discos() -> tuple:
+    """Espaço e inodes de todas as montagens, com botões para ver as maiores pastas"""
+    try:
+        discos = await executor_bloqueante.executar(listar_discos)
+    except Exception as e:
+        return escape_markdown(f"❌ Erro ao listar discos: {e}"), TECLADOS_VOLTAR[MENU_SISTEMA]
+    
+    texto = md("💾 *Discos*\n\n")
+    for disco in discos:
+        texto += md(
+            "*{}* ({}, {})\n"
+            "  • `{}` {:.1f}%\n"
+            "  • Usado: {:.1f} de {:.1f} GB, livre {:.1f} GB\n"
+            "  • Inodes: {:.1f}% ({} de {})\n\n",
+            disco["ponto"], disco["dispositivo"], disco["tipo"],
+            _barra(disco["uso"]), disco["uso"],
+            disco["usado"] / GB, disco["total"] / GB, disco["livre"] / GB,
+            disco["inodes"], disco["inodes_usados"], disco["inodes_total"]
+        )
+    
+    botoes = [(f"📂 {disco['ponto']}", f"dir:{_id_caminho(disco['ponto'])}") for disco in discos[:8]]
+    teclado = _teclado(*[botoes[i:i + 2] for i in range(0, len(botoes), 2)], [_voltar(MENU_SISTEMA)])
+    return texto, teclado
+
+@coalescer
+async def obter_diretorios(caminho: str, forcar: bool = False) -> tuple:
+    """Maiores subpastas de `caminho`, com drill-down pelos botões"""
+    id_caminho = _id_caminho(caminho)
+    voltar = _teclado([("💾 Discos", "disco")])
+    try:
+        resultado, idade = await cache_ttl.obter(
+            f"diretorios:{caminho}",
+            lambda: executor_bloqueante.executar(
+                medidor_diretorios.medir, caminho, grupo="diretorios",
+                timeout=ORCAMENTO_DIRETORIOS + TIMEOUT_TAREFA_PADRAO, nome=f"du {caminho}"
+            ),
+            forcar
+        )
+    except TarefaOcupada:
+        return md("⏳ Já existe uma medição de pastas em andamento, tente novamente em instantes."), voltar
+    except PermissionError:
+        return md("🚫 Sem permissão para ler `{}`.", caminho), voltar
+    except Exception as e:
+        return escape_markdown(f"❌ Erro ao medir pastas: {e}"), voltar
     
-    welcome_msg = escape_markdown(
-        "🤖 *Bem-vindo ao BOT-T-Terminal*\n\n"
-        "Controle e monitore seu servidor através deste bot.\n"
-        "Escolha uma opção abaixo:"
+    total = resultado["total"] or 1
+    texto = md(
+        "📂 *Maiores pastas* em `{}`\n"
+        "Total: {:.2f} GB, medido em {:.1f}s ({})\n\n",
+        caminho, resultado["total"] / GB, resultado["duracao"], formatar_idade(idade)
     )
+    botoes = []
+    for item, tamanho in resultado["itens"]:
+        nome = "(arquivos)" if item is None else os.path.basename(item)
+        texto += md("`{}` {:>7.2f} GB  {}\n", _barra(tamanho / total * 100), tamanho / GB, nome)
+        if item is not None and len(botoes) < 6:
+            botoes.append((f"📁 {nome[:20]}", f"dir:{_id_caminho(item)}"))
+    if resultado["parcial"]:
+        texto += md("\n⚠️ Resultado parcial: limite de tempo ou profundidade atingido.")
+    if resultado["erros"]:
+        texto += md("\n⚠️ {} entradas não puderam ser lidas.", resultado["erros"])
     
-    await update.message.reply_text(
-        welcome_msg,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode=ParseMode.MARKDOWN_V2
+    navegacao = [("🔄 Medir novamente", f"dir:{id_caminho}:novo")]
+    pai = os.path.dirname(caminho.rstrip("/")) or "/"
+    if pai != caminho:
+        navegacao.insert(0, ("⬆️ Acima", f"dir:{_id_caminho(pai)}"))
+    teclado = _teclado(*[botoes[i:i + 2] for i in range(0, len(botoes), 2)], navegacao, [("💾 Discos", "disco")])
+    return texto, teclado
+
+@coalescer
+async def obter_memoria() -> str:
+    """Detalhes de RAM e swap e os processos que mais usam memória"""
+    try:
+        amostra = await amostrador.snapshot_async()
+        if amostra is None:
+            return escape_markdown("⏳ Coletando métricas, tente novamente em instantes.")
+        mem, swap = amostra["mem"], amostra["swap"]
+        
+        texto = md(
+            "🧠 *Memória*\n\n"
+            "*RAM*: `{}` {}%\n"
+            "  • Total: {:.2f} GB\n"
+            "  • Usada: {:.2f} GB\n"
+            "  • Disponível: {:.2f} GB\n",
+            _barra(mem.percent), mem.percent, mem.total / GB, mem.used / GB, mem.available / GB
+        )
+        for campo, rotulo in (("buffers", "Buffers"), ("cached", "Cache"), ("shared", "Compartilhada")):
+            valor = getattr(mem, campo, None)
+            if valor is not None:
+                texto += md("  • {}: {:.2f} GB\n", rotulo, valor / GB)
+        texto += md(
+            "\n*Swap*: `{}` {}%\n"
+            "  • Usada: {:.2f} de {:.2f} GB\n",
+            _barra(swap.percent), swap.percent, swap.used / GB, swap.total / GB
+        )
+        
+        await tabela_processos.aguardar()
+        texto += md("\n*Maiores consumidores*\n")
+        for proc in tabela_processos.top(5, "memoria"):
+            texto += md("• {} (`{}`): {:.1f}%\n", proc.name[:20], proc.pid, proc.memory_percent)
+        return texto
+    except Exception as e:
+        return escape_markdown(f"❌ Erro ao obter memória: {e}")
+
+def resolver_log(nome: str) -> Optional[str]:
+    """Primeiro caminho existente configurado para o log `nome`"""
+    for caminho in LOGS_CONFIGURADOS.get(nome, []):
+        if os.path.isfile(caminho):
+            return caminho
+    return None
+
+def ler_log_anterior(caminho: str, fim: Optional[int] = None, limite_bytes: int = TAMANHO_PAGINA_LOG,
+                     max_linhas: int = MAX_LINHAS_PAGINA_LOG) -> Dict[str, Any]:
+    """Lê as linhas que terminam antes do offset `fim` (None = fim do arquivo).
+
+    Lê blocos de trás para frente com seek, então o custo independe do
+    tamanho do arquivo. Retorna as linhas e os offsets [inicio, fim).
+    """
+    with open(caminho, 'rb') as f:
+        tamanho = os.fstat(f.fileno()).st_size
+        fim = tamanho if fim is None else min(fim, tamanho)
+        pos = fim
+        dados = b""
+        while pos > 0 and len(dados) <= limite_bytes:
+            bloco = min(TAMANHO_BLOCO_LOG, pos)
+            pos -= bloco
+            f.seek(pos)
+            dados = f.read(bloco) + dados
+    
+    # Descarta a primeira linha, que pode ter começado antes do trecho lido
+    if pos > 0:
+        quebra = dados.find(b"\n")
+        if 0 <= quebra < len(dados) - 1:
+            dados = dados[quebra + 1:]
+    
+    linhas = dados.split(b"\n")
+    termina_com_quebra = linhas[-1] == b""
+    if termina_com_quebra:
+        linhas.pop()
+    
+    escolhidas = []
+    consumido = 0
+    for linha in reversed(linhas):
+        if escolhidas and (len(escolhidas) >= max_linhas or consumido + len(linha) + 1 > limite_bytes):
+            break
+        escolhidas.append(linha)
+        consumido += len(linha) + 1
+    escolhidas.reverse()
+    if not termina_com_quebra and escolhidas:
+        consumido -= 1
+    
+    return {"linhas": escolhidas, "inicio": max(fim - consumido, 0), "fim": fim, "tamanho": tamanho}
+
+def ler_log_seguinte(caminho: str, inicio: int, limite_bytes: int = TAMANHO_PAGINA_LOG,
+                     max_linhas: int = MAX_LINHAS_PAGINA_LOG) -> Dict[str, Any]:
+    """Lê as linhas completas a partir do offset `inicio`"""
+    with open(caminho, 'rb') as f:
+        tamanho = os.fstat(f.fileno()).st_size
+        inicio = min(inicio, tamanho)
+        f.seek(inicio)
+        dados = f.read(limite_bytes)
+    
+    linhas = dados.split(b"\n")
+    no_fim = inicio + len(dados) >= tamanho
+    # A última linha só entra se estiver completa (ou se for a única)
+    if linhas[-1] == b"" or (not no_fim and len(linhas) > 1):
+        linhas.pop()
+    linhas = linhas[:max_linhas]
+    consumido = min(sum(len(linha) + 1 for linha in linhas), len(dados))
+    return {"linhas": linhas, "inicio": inicio, "fim": inicio + consumido, "tamanho": tamanho}
+
+@coalescer
+async def obter_pagina_log(nome: str, cursor: Optional[str] = None) -> tuple:
+    """Renderiza uma página do log; `cursor` é "-<offset>" (anteriores) ou "+<offset>" (seguintes)"""
+    rotulo = ROTULOS_LOGS.get(nome, f"📄 {nome}")
+    voltar = TECLADOS_VOLTAR[MENU_LOGS]
+    caminho = resolver_log(nome)
+    if caminho is None:
+        return md("⚠️ Nenhum arquivo encontrado para o log *{}*.", rotulo), voltar
+    
+    try:
+        if cursor and cursor[0] == "+":
+            pagina = await executor_bloqueante.executar(ler_log_seguinte, caminho, int(cursor[1:]))
+        else:
+            fim = int(cursor[1:]) if cursor and cursor[0] == "-" else None
+            pagina = await executor_bloqueante.executar(ler_log_anterior, caminho, fim)
+    except PermissionError:
+        return md("🚫 Sem permissão para ler `{}`.", caminho), voltar
+    except Exception as e:
+        return escape_markdown(f"❌ Erro ao ler log: {e}"), voltar
+    
+    linhas = [
+        linha.decode('utf-8', errors='replace')[:MAX_CARACTERES_LINHA_LOG]
+        for linha in pagina["linhas"]
+    ]
+    conteudo = escape_markdown_pre("\n".join(linhas)) or " "
+    texto = (
+        md("📝 *{}* `{}`\n", rotulo, caminho)
+        + f"```\n{conteudo}\n```\n"
+        + md("Bytes {}–{} de {}", pagina["inicio"], pagina["fim"], pagina["tamanho"])
     )
+    
+    navegacao = []
+    if pagina["inicio"] > 0:
+        navegacao.append(("⏪ Anteriores", f"log:{nome}:-{pagina['inicio']}"))
+    if pagina["fim"] < pagina["tamanho"]:
+        navegacao.append(("⏩ Seguintes", f"log:{nome}:+{pagina['fim']}"))
+    teclado = _teclado(
+        navegacao,
+        [("⏬ Mais recentes", f"log:{nome}"), ("📡 Acompanhar", f"tail:{nome}")],
+        [_voltar(MENU_LOGS)]
+    )
+    return texto, teclado
 
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handler para botões inline"""
-    if not await verificar_autorizacao(update):
+class SeguidorLog:
+    """Acompanha um arquivo como `tail -F`, filtrando as linhas no servidor.
+
+    Detecta rotação (troca de inode) e truncamento. Só as últimas linhas
+    que passam no filtro ficam em memória; se o arquivo crescer mais que
+    MAX_BYTES_LEITURA_TAIL entre duas leituras, o excesso é pulado e contado.
+    """
+
+    def __init__(self, caminho: str, filtro: Optional["re.Pattern"] = None):
+        self.caminho = caminho
+        self.filtro = filtro
+        self.linhas: deque = deque(maxlen=MAX_LINHAS_TAIL)
+        self.lidas = 0
+        self.casadas = 0
+        self.bytes_pulados = 0
+        self.rotacoes = 0
+        self._arquivo = None
+        self._id_arquivo = None
+        self._pos = 0
+        self._resto = b""
+
+    def abrir(self):
+        """Abre o arquivo posicionado no final"""
+        self._arquivo = open(self.caminho, 'rb')
+        st = os.fstat(self._arquivo.fileno())
+        self._id_arquivo = (st.st_dev, st.st_ino)
+        self._pos = st.st_size
+
+    def fechar(self):
+        if self._arquivo:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def ler(self) -> bool:
+        """Consome o que foi acrescentado desde a última leitura; retorna se houve linhas novas"""
+        casadas = self.casadas
+        try:
+            st = os.stat(self.caminho)
+        except FileNotFoundError:
+            # Rotação em andamento: o arquivo novo ainda não foi criado
+            return False
+        
+        if (st.st_dev, st.st_ino) != self._id_arquivo:
+            # Termina o arquivo antigo antes de trocar para o novo
+            self._consumir()
+            self.fechar()
+            self._arquivo = open(self.caminho, 'rb')
+            st = os.fstat(self._arquivo.fileno())
+            self._id_arquivo = (st.st_dev, st.st_ino)
+            self._pos, self._resto = 0, b""
+            self.rotacoes += 1
+        elif st.st_size < self._pos:
+            self._pos, self._resto = 0, b""
+            self.rotacoes += 1
+        
+        self._consumir()
+        return self.casadas != casadas
+
+    def _consumir(self):
+        tamanho = os.fstat(self._arquivo.fileno()).st_size
+        pendente = tamanho - self._pos
+        if pendente <= 0:
+            return
+        pular = pendente - MAX_BYTES_LEITURA_TAIL
+        if pular > 0:
+            self._pos += pular
+            self.bytes_pulados += pular
+        self._arquivo.seek(self._pos)
+        dados = self._arquivo.read(MAX_BYTES_LEITURA_TAIL)
+        self._pos += len(dados)
+        
+        if pular > 0:
+            # Recomeça na primeira linha completa após o salto
+            quebra = dados.find(b"\n")
+            self._resto, dados = b"", dados[quebra + 1:] if quebra >= 0 else b""
+        
+        linhas = (self._resto + dados).split(b"\n")
+        self._resto = linhas.pop()
+        if len(self._resto) > MAX_BYTES_LEITURA_TAIL:
+            self._resto = b""
+        
+        self.lidas += len(linhas)
+        if self.filtro is not None:
+            buscar = self.filtro.search
+            linhas = [linha for linha in linhas if buscar(linha)]
+        self.casadas += len(linhas)
+        self.linhas.extend(linhas[-MAX_LINHAS_TAIL:])
+
+def _renderizar_tail(nome: str, seguidor: SeguidorLog, rodape: str) -> str:
+    """Monta a mensagem do /tail com as linhas mais recentes que cabem"""
+    filtro = seguidor.filtro.pattern.decode('utf-8', errors='replace') if seguidor.filtro else None
+    cabecalho = md("📡 *Tail* `{}`", seguidor.caminho)
+    if filtro:
+        cabecalho += md("\n🔎 Filtro: `{}`", filtro)
+    estatisticas = f"Linhas: {seguidor.lidas} lidas, {seguidor.casadas} exibíveis"
+    if seguidor.rotacoes:
+        estatisticas += f", {seguidor.rotacoes} rotação(ões)"
+    if seguidor.bytes_pulados:
+        estatisticas += f", {seguidor.bytes_pulados} bytes pulados"
+    rodape = escape_markdown(f"{estatisticas}\n{rodape}")
+    
+    folga = LIMITE_MENSAGEM - len(cabecalho) - len(rodape) - 16
+    blocos = []
+    for linha in reversed(seguidor.linhas):
+        bloco = escape_markdown_pre(linha.decode('utf-8', errors='replace')[:MAX_CARACTERES_LINHA_LOG])
+        folga -= len(bloco) + 1
+        if folga < 0:
+            break
+        blocos.append(bloco)
+    if not blocos:
+        return cabecalho + md("\n\n⏳ Aguardando linhas...\n") + rodape
+    blocos.reverse()
+    return f"{cabecalho}\n```\n" + "\n".join(blocos) + f"\n```\n{rodape}"
+
+# Acompanhamentos ativos: id -> (usuário, tarefa)
+SEGUIDORES: Dict[int, tuple] = {}
+_ids_seguidores = itertools.count(1)
+
+async def seguir_log(id_seguidor: int, nome: str, seguidor: SeguidorLog, mensagem: Message,
+                     duracao: float = DURACAO_MAXIMA_TAIL):
+    """Lê o log a cada INTERVALO_TAIL e edita a mensagem no máximo a cada INTERVALO_EDICAO"""
+    teclado = _teclado([("⏹ Parar", f"tail_parar:{id_seguidor}")])
+    inicio = ultima_edicao = time.monotonic()
+    pendente = True
+    rodape = f"⏹ Encerrado após {duracao:.0f}s"
+    try:
+        while time.monotonic() - inicio < duracao:
+            # aguardar_fim: fechar() e a renderização final não podem concorrer com ler() na thread
+            pendente |= await executor_bloqueante.executar(
+                seguidor.ler, grupo="tail", nome=f"tail {nome}", aguardar_fim=True
+            )
+            agora = time.monotonic()
+            if pendente and agora - ultima_edicao >= INTERVALO_EDICAO:
+                ultima_edicao = agora
+                pendente = False
+                await _editar_mensagem(
+                    mensagem, _renderizar_tail(nome, seguidor, f"🔴 Ao vivo há {agora - inicio:.0f}s"), teclado
+                )
+            await asyncio.sleep(INTERVALO_TAIL)
+    except asyncio.CancelledError:
+        rodape = "⏹ Parado"
+    except Exception as e:
+        logger.error(f"Erro ao acompanhar {seguidor.caminho}: {e}")
+        rodape = f"❌ Erro: {e}"
+    finally:
+        SEGUIDORES.pop(id_seguidor, None)
+        seguidor.fechar()
+    await _editar_mensagem(mensagem, _renderizar_tail(nome, seguidor, rodape))
+
+async def iniciar_tail(mensagem: Message, usuario: int, nome: str, padrao: Optional[str] = None):
+    """Valida os argumentos e inicia o acompanhamento do log em uma nova mensagem"""
+    if nome not in LOGS_CONFIGURADOS:
+        disponiveis = ", ".join(LOGS_CONFIGURADOS)
+        await _responder(mensagem, md("⚠️ Log desconhecido: `{}`\nDisponíveis: {}", nome, disponiveis))
+        return
+    caminho = resolver_log(nome)
+    if caminho is None:
+        await _responder(mensagem, md("⚠️ Nenhum arquivo encontrado para o log *{}*.", nome))
+        return
+    if sum(1 for dono, _ in SEGUIDORES.values() if dono == usuario) >= MAX_TAILS_USUARIO:
+        await _responder(mensagem, md("⚠️ Você já tem {} acompanhamentos ativos.", MAX_TAILS_USUARIO))
         return
     
-    query = update.callback_query
-    await query.answer()
+    try:
+        filtro = re.compile(padrao.encode('utf-8')) if padrao else None
+    except re.error as e:
+        await _responder(mensagem, md("❌ Expressão regular inválida: {}", str(e)))
+        return
     
-    if query.data == MENU_SISTEMA:
-        keyboard = [
-            [
-                InlineKeyboardButton("📊 Status", callback_data="status"),
-                InlineKeyboardButton("🔄 Processos", callback_data="processos")
-            ],
-            [
-                InlineKeyboardButton("💾 Disco", callback_data="disco"),
-                InlineKeyboardButton("🧠 Memória", callback_data="memoria")
-            ],
-            [
-                InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_PRINCIPAL)
-            ]
-        ]
-        await query.edit_message_text(
-            escape_markdown("💻 *Menu Sistema*\nEscolha uma opção:"),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
+    seguidor = SeguidorLog(caminho, filtro)
+    try:
+        seguidor.abrir()
+    except PermissionError:
+        await _responder(mensagem, md("🚫 Sem permissão para ler `{}`.", caminho))
+        return
+    
+    id_seguidor = next(_ids_seguidores)
+    enviada = await _responder(mensagem, _renderizar_tail(nome, seguidor, "🔴 Iniciando..."))
+    tarefa = asyncio.create_task(seguir_log(id_seguidor, nome, seguidor, enviada))
+    SEGUIDORES[id_seguidor] = (usuario, tarefa)
+
+class AnalisadorAuth:
+    """Indexa falhas de login SSH do auth.log (ou do journal) em SQLite.
+
+    Guarda o offset (ou o cursor do journal) já processado, então cada
+    atualização só lê as linhas novas. As falhas ficam agregadas por hora,
+    IP e usuário, e as consultas do menu não precisam reler o log.
+    """
+
+    PADRAO_FALHA = re.compile(rb"sshd(?:-session)?\[\d+\]: Failed \S+ for (?:invalid user )?(\S*) from (\S+)")
+    PADRAO_SYSLOG = re.compile(rb"^([A-Z][a-z]{2}) +(\d{1,2}) (\d\d):(\d\d):(\d\d) ")
+    # short-iso do journalctl e RFC 3339 do rsyslog; frações de segundo são descartadas
+    PADRAO_ISO = re.compile(rb"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:[.,]\d+)?(Z|[+-]\d\d:?\d\d)?(?:\s|$)")
+    MESES = {m.encode(): i for i, m in enumerate(
+        ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], 1
+    )}
+
+    def __init__(self, banco: str = BANCO_SEGURANCA):
+        self.banco = banco
+        self._conexao: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            conexao = sqlite3.connect(self.banco, check_same_thread=False)
+            conexao.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS posicao (
+                    origem TEXT PRIMARY KEY, inode INTEGER, offset INTEGER, cursor TEXT
+                );
+                CREATE TABLE IF NOT EXISTS falhas (
+                    hora INTEGER, ip TEXT, usuario TEXT, quantidade INTEGER,
+                    PRIMARY KEY (hora, ip, usuario)
+                ) WITHOUT ROWID;
+            """)
+            self._conexao = conexao
+        return self._conexao
+
+    def _horario(self, linha: bytes, agora: datetime) -> Optional[int]:
+        """Início da hora (epoch) da linha, no formato syslog clássico ou ISO 8601"""
+        if linha[:1].isdigit():
+            # strptime em vez de fromisoformat: este só aceita +0000 (systemd antigo) a partir do 3.11
+            m = self.PADRAO_ISO.match(linha)
+            if not m:
+                return None
+            base, fuso = m.group(1).decode(), (m.group(2) or b"").decode()
+            try:
+                data = datetime.strptime(base + fuso, "%Y-%m-%dT%H:%M:%S%z" if fuso else "%Y-%m-%dT%H:%M:%S")
+            except ValueError:
+                return None
+            return int(data.timestamp()) // 3600 * 3600
+        m = self.PADRAO_SYSLOG.match(linha)
+        if not m or m.group(1) not in self.MESES:
+            return None
+        data = datetime(agora.year, self.MESES[m.group(1)], int(m.group(2)), int(m.group(3)))
+        if data > agora + timedelta(days=1):
+            # O syslog clássico não tem ano: linhas "do futuro" são do ano passado
+            data = data.replace(year=agora.year - 1)
+        return int(data.timestamp())
+
+    def _agregar(self, linhas, contagem: Dict[tuple, int]):
+        agora = datetime.now()
+        buscar = self.PADRAO_FALHA.search
+        for linha in linhas:
+            m = buscar(linha)
+            if not m:
+                continue
+            hora = self._horario(linha, agora)
+            if hora is None:
+                continue
+            chave = (hora, m.group(2).decode(errors='replace'), m.group(1).decode(errors='replace'))
+            contagem[chave] = contagem.get(chave, 0) + 1
+
+    def _ler_arquivo(self, caminho: str, conexao: sqlite3.Connection, contagem: Dict[tuple, int]):
+        linha = conexao.execute("SELECT inode, offset FROM posicao WHERE origem = ?", (caminho,)).fetchone()
+        with open(caminho, 'rb') as f:
+            st = os.fstat(f.fileno())
+            inode, offset = linha if linha else (st.st_ino, 0)
+            if inode != st.st_ino or st.st_size < offset:
+                # Log rotacionado ou truncado: recomeça do início do arquivo novo
+                offset = 0
+            f.seek(offset)
+            dados = f.read(min(st.st_size - offset, MAX_BYTES_ANALISE))
+        fim = dados.rfind(b"\n") + 1
+        self._agregar(dados[:fim].split(b"\n"), contagem)
+        conexao.execute(
+            "INSERT OR REPLACE INTO posicao (origem, inode, offset) VALUES (?, ?, ?)",
+            (caminho, st.st_ino, offset + fim)
         )
+
+    def _ler_journal(self, conexao: sqlite3.Connection, contagem: Dict[tuple, int]):
+        linha = conexao.execute("SELECT cursor FROM posicao WHERE origem = 'journal'").fetchone()
+        comando = ["journalctl", "-t", "sshd", "-t", "sshd-session", "-o", "short-iso", "--no-pager", "--show-cursor"]
+        comando += [f"--after-cursor={linha[0]}"] if linha and linha[0] else ["--since", "-30d"]
+        saida = subprocess.run(comando, capture_output=True, timeout=TIMEOUT_TAREFA_PADRAO, check=True).stdout
+        linhas = saida.splitlines()
+        if linhas and linhas[-1].startswith(b"-- cursor: "):
+            cursor = linhas.pop()[len(b"-- cursor: "):].decode()
+            conexao.execute("INSERT OR REPLACE INTO posicao (origem, cursor) VALUES ('journal', ?)", (cursor,))
+        self._agregar(linhas, contagem)
+
+    def atualizar(self) -> int:
+        """Processa as linhas novas e retorna quantas falhas foram indexadas"""
+        contagem: Dict[tuple, int] = {}
+        with self._lock:
+            conexao = self._conectar()
+            with conexao:
+                caminho = resolver_log("seguranca")
+                if caminho:
+                    self._ler_arquivo(caminho, conexao, contagem)
+                elif shutil.which("journalctl"):
+                    self._ler_journal(conexao, contagem)
+                else:
+                    raise FileNotFoundError("auth.log e journalctl indisponíveis")
+                conexao.executemany(
+                    "INSERT INTO falhas (hora, ip, usuario, quantidade) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (hora, ip, usuario) DO UPDATE SET quantidade = quantidade + excluded.quantidade",
+                    [(*chave, n) for chave, n in contagem.items()]
+                )
+                conexao.execute("DELETE FROM falhas WHERE hora < ?", (int(time.time()) - RETENCAO_SEGURANCA,))
+        return sum(contagem.values())
+
+    def resumo(self, segundos: int = 24 * 3600, limite: int = TOP_OFENSORES) -> Dict[str, Any]:
+        """Totais e maiores ofensores (IPs e usuários) na janela"""
+        desde = int(time.time()) // 3600 * 3600 - segundos + 3600
+        with self._lock:
+            conexao = self._conectar()
+            total, ips = conexao.execute(
+                "SELECT COALESCE(SUM(quantidade), 0), COUNT(DISTINCT ip) FROM falhas WHERE hora >= ?", (desde,)
+            ).fetchone()
+            top_ips = conexao.execute(
+                "SELECT ip, SUM(quantidade) AS n, COUNT(DISTINCT usuario) FROM falhas WHERE hora >= ? "
+                "GROUP BY ip ORDER BY n DESC LIMIT ?", (desde, limite)
+            ).fetchall()
+            top_usuarios = conexao.execute(
+                "SELECT usuario, SUM(quantidade) AS n FROM falhas WHERE hora >= ? "
+                "GROUP BY usuario ORDER BY n DESC LIMIT 5", (desde,)
+            ).fetchall()
+        return {"total": total, "ips": ips, "top_ips": top_ips, "top_usuarios": top_usuarios}
+
+analisador_auth = AnalisadorAuth()
+
+@coalescer
+async def obter_falhas_ssh() -> str:
+    """Atualiza o índice com as linhas novas e mostra os maiores ofensores das últimas 24h"""
+    try:
+        await executor_bloqueante.executar(analisador_auth.atualizar, grupo="seguranca", timeout=TIMEOUT_ANALISE)
+    except TarefaOcupada:
+        pass
+    except Exception as e:
+        logger.error(f"Erro ao analisar log de autenticação: {e}")
+        return escape_markdown(f"❌ Erro ao analisar log de autenticação: {e}")
     
-    elif query.data == MENU_USUARIOS:
-        keyboard = [
-            [
-                InlineKeyboardButton("👥 Listar", callback_data="usuarios_listar"),
-                InlineKeyboardButton("🔑 SSH", callback_data="usuarios_ssh")
-            ],
-            [
-                InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_PRINCIPAL)
-            ]
-        ]
-        await query.edit_message_text(
-            escape_markdown("👥 *Menu Usuários*\nEscolha uma opção:"),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
+    dados = await executor_bloqueante.executar(analisador_auth.resumo)
+    texto = md(
+        "🚨 *Falhas de login SSH* (últimas 24h)\n\n"
+        "• Tentativas: {}\n"
+        "• IPs distintos: {}\n",
+        dados["total"], dados["ips"]
+    )
+    if dados["top_ips"]:
+        texto += md("\n*Maiores ofensores*\n")
+        for ip, n, usuarios in dados["top_ips"]:
+            texto += md("• `{}`: {} tentativas, {} usuário(s)\n", ip, n, usuarios)
+    if dados["top_usuarios"]:
+        texto += md("\n*Usuários mais tentados*\n")
+        for usuario, n in dados["top_usuarios"]:
+            texto += md("• `{}`: {}\n", usuario or "?", n)
+    return texto
+
+def consultar_systemctl(unidades: List[str], comando: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+    """Estado de todas as unidades com um único `systemctl show`.
+
+    O systemctl devolve um bloco de propriedades por unidade, na ordem dos
+    argumentos e separados por linha em branco.
+    """
+    if not unidades:
+        return {}
+    saida = subprocess.run(
+        [comando or COMANDO_SYSTEMCTL, "show", "--no-pager",
+         "--property=" + ",".join(PROPRIEDADES_SERVICO), "--", *unidades],
+        capture_output=True, text=True, timeout=TIMEOUT_TAREFA_PADRAO
+    ).stdout
+    estados = {}
+    for unidade, bloco in zip(unidades, saida.strip("\n").split("\n\n")):
+        estados[unidade] = dict(linha.split("=", 1) for linha in bloco.splitlines() if "=" in linha)
+    return estados
+
+class MonitorServicos:
+    """Consulta em lote o estado das unidades e detecta mudanças.
+
+    `consultor(unidades)` deve retornar {unidade: {propriedade: valor}};
+    o padrão é consultar_systemctl, e pode ser trocado por um falso.
+    """
+
+    def __init__(self, unidades: List[str] = SERVICOS_MONITORADOS, consultor=consultar_systemctl):
+        self.unidades = list(unidades)
+        self.consultor = consultor
+        self._anteriores: Dict[str, str] = {}
+
+    async def estados(self, forcar: bool = False) -> tuple:
+        """Retorna (estados, idade), com cache curto compartilhado com o monitoramento"""
+        return await cache_ttl.obter(
+            "servicos", lambda: executor_bloqueante.executar(self.consultor, self.unidades), forcar
         )
+
+    async def mudancas(self) -> List[str]:
+        """Consulta novamente e retorna alertas (Markdown V2) das unidades que mudaram de estado"""
+        estados, _ = await self.estados(forcar=True)
+        mensagens = []
+        for unidade, propriedades in estados.items():
+            atual = propriedades.get("ActiveState", "desconhecido")
+            anterior = self._anteriores.get(unidade)
+            self._anteriores[unidade] = atual
+            if anterior is not None and anterior != atual:
+                mensagens.append(md(
+                    "{} *Serviço {}*: {} → {}",
+                    EMOJIS_SERVICO.get(atual, "❔"), unidade, anterior, atual
+                ))
+        return mensagens
+
+monitor_servicos = MonitorServicos()
+
+@coalescer
+async def obter_status_servicos(forcar: bool = False) -> str:
+    """Status de todos os serviços monitorados"""
+    if not monitor_servicos.unidades:
+        return md("🔧 *Serviços*\n\nNenhum serviço configurado em `servicos` no config.json.")
+    try:
+        estados, idade = await monitor_servicos.estados(forcar)
+    except Exception as e:
+        logger.error(f"Erro ao consultar serviços: {e}")
+        return escape_markdown(f"❌ Erro ao consultar serviços: {e}")
     
-    elif query.data == MENU_SERVICOS:
-        keyboard = [
-            [
-                InlineKeyboardButton("📊 Status", callback_data="servicos_status"),
-                InlineKeyboardButton("🔄 Reiniciar", callback_data="servicos_restart")
-            ],
-            [
-                InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_PRINCIPAL)
-            ]
-        ]
-        await query.edit_message_text(
-            escape_markdown("🔧 *Menu Serviços*\nEscolha uma opção:"),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
+    texto = md("🔧 *Serviços* ({})\n\n", formatar_idade(idade))
+    for unidade in monitor_servicos.unidades:
+        propriedades = estados.get(unidade, {})
+        if propriedades.get("LoadState") == "not-found":
+            texto += md("❔ *{}*: não encontrado\n", unidade)
+            continue
+        ativo = propriedades.get("ActiveState", "desconhecido")
+        texto += md(
+            "{} *{}*: {} ({})\n",
+            EMOJIS_SERVICO.get(ativo, "❔"), unidade, ativo, propriedades.get("SubState", "?")
         )
+        if propriedades.get("MainPID", "0") != "0":
+            texto += md("  • PID: {}\n", propriedades["MainPID"])
+    return texto
+
+def obter_ip_publico() -> str:
+    """Consulta o IP público (bloqueante, rodar via executor)"""
+    response = requests.get('https://api.ipify.org?format=json', timeout=TIMEOUT_HTTP)
+    response.raise_for_status()
+    return response.json()['ip']
+
+def resumir_conexoes(limite: int = TOP_CONEXOES) -> Dict[str, Any]:
+    """Agrupa as conexões por estado, porta local e IP remoto em uma única passada.
+
+    Bloqueante e caro em hosts com muitos sockets: rodar via executor e cache.
+    """
+    estados: Dict[str, int] = {}
+    portas: Dict[int, int] = {}
+    remotos: Dict[str, int] = {}
+    escutando = set()
+    total = 0
+    for c in psutil.net_connections(kind="inet"):
+        total += 1
+        estados[c.status] = estados.get(c.status, 0) + 1
+        if c.status == psutil.CONN_LISTEN:
+            escutando.add(c.laddr.port)
+        elif c.raddr:
+            portas[c.laddr.port] = portas.get(c.laddr.port, 0) + 1
+            remotos[c.raddr.ip] = remotos.get(c.raddr.ip, 0) + 1
     
-    elif query.data == MENU_SEGURANCA:
-        keyboard = [
-            [
-                InlineKeyboardButton("🔒 Firewall", callback_data="seguranca_firewall"),
-                InlineKeyboardButton("🛡️ Fail2Ban", callback_data="seguranca_fail2ban")
-            ],
-            [
-                InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_PRINCIPAL)
-            ]
-        ]
-        await query.edit_message_text(
-            escape_markdown("🔒 *Menu Segurança*\nEscolha uma opção:"),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
+    def top(contagem):
+        return heapq.nlargest(limite, contagem.items(), key=lambda item: item[1])
+    
+    return {
+        "total": total,
+        "estados": top(estados),
+        # Portas efêmeras de conexões de saída não interessam: só serviços locais
+        "portas": top({porta: n for porta, n in portas.items() if porta in escutando}),
+        "remotos": top(remotos),
+        "escutando": sorted(escutando)
+    }
+
+@coalescer
+async def obter_info_rede() -> str:
+    """Obtém informações detalhadas da rede"""
+    try:
+        ip_resultado, *resultados = await asyncio.gather(
+            cache_ttl.obter("ip_publico", lambda: executor_bloqueante.executar(obter_ip_publico, timeout=TIMEOUT_HTTP + 1)),
+            cache_ttl.obter("conexoes", lambda: executor_bloqueante.executar(resumir_conexoes)),
+            cache_ttl.obter("interfaces", lambda: executor_bloqueante.executar(psutil.net_if_stats)),
+            return_exceptions=True
+        )
+        for resultado in resultados:
+            if isinstance(resultado, BaseException):
+                raise resultado
+        (conexoes, idade_conexoes), (interfaces, _) = resultados
+        amostra = await amostrador.snapshot_async()
+        taxas_rede = amostra.get("taxas_rede", {}) if amostra else {}
+        
+        texto = md("🌐 *Informações de Rede*\n\n")
+        
+        if not isinstance(ip_resultado, BaseException):
+            ip_publico, idade_ip = ip_resultado
+            texto += md("🌍 *IP Público*: `{}` ({})\n\n", ip_publico, formatar_idade(idade_ip))
+        else:
+            logger.warning(f"Falha ao obter IP público: {ip_resultado!r}")
+        
+        texto += md("📡 *Interfaces*:\n\n")
+        for nome, stats in interfaces.items():
+            if nome != 'lo':
+                taxas = taxas_rede.get(nome)
+                texto += md(
+                    "*{}*:\n"
+                    "  • Status: {}\n"
+                    "  • Velocidade: {} Mbps\n",
+                    nome, '🟢 Ativo' if stats.isup else '🔴 Inativo', stats.speed
+                )
+                if taxas:
+                    texto += md(
+                        "  • Download: {} ({:.0f} pkt/s)\n"
+                        "  • Upload: {} ({:.0f} pkt/s)\n",
+                        formatar_taxa(taxas["rx"]), taxas["pacotes_rx"],
+                        formatar_taxa(taxas["tx"]), taxas["pacotes_tx"]
+                    )
+                    if taxas["erros"] or taxas["descartes"]:
+                        texto += md(
+                            "  • ⚠️ Erros: {:.1f}/s, descartes: {:.1f}/s\n",
+                            taxas["erros"], taxas["descartes"]
+                        )
+                texto += "\n"
+        
+        texto += md(
+            "🔌 *Conexões* ({}, {}):\n",
+            conexoes["total"], formatar_idade(idade_conexoes)
         )
+        for estado, quantidade in conexoes["estados"]:
+            texto += md("  • {}: {}\n", estado, quantidade)
+        if conexoes["escutando"]:
+            portas = ", ".join(map(str, conexoes["escutando"][:20]))
+            texto += md("  • Portas escutando: {}\n", portas)
+        if conexoes["portas"]:
+            texto += md("\n*Serviços locais mais acessados*:\n")
+            for porta, quantidade in conexoes["portas"]:
+                texto += md("  • Porta {}: {} conexões\n", porta, quantidade)
+        if conexoes["remotos"]:
+            texto += md("\n*IPs remotos com mais conexões*:\n")
+            for ip, quantidade in conexoes["remotos"]:
+                texto += md("  • `{}`: {}\n", ip, quantidade)
+        
+        return texto
+    except Exception as e:
+        return escape_markdown(f"❌ Erro ao obter informações de rede: {e}")
+
+@coalescer
+async def obter_historico(periodo: str) -> str:
+    """Resume o histórico de métricas do período (1h, 6h ou 24h)"""
+    try:
+        segundos = PERIODOS_HISTORICO[periodo]
+        series = historico.janela(segundos)
+        if not series["cpu"]:
+            return escape_markdown("⏳ Ainda não há histórico coletado.")
+        
+        rotulos = {
+            "cpu": ("📊 CPU", lambda v: f"{v:.1f}%"),
+            "ram": ("🧠 RAM", lambda v: f"{v:.1f}%"),
+            "disco": ("💾 Disco", lambda v: f"{v:.1f}%"),
+            "rede_rx": ("⬇️ Rede RX", formatar_taxa),
+            "rede_tx": ("⬆️ Rede TX", formatar_taxa)
+        }
+        
+        texto = md("📈 *Histórico ({})*\n{} amostras\n\n", periodo, len(series['cpu']))
+        for nome, (titulo, fmt) in rotulos.items():
+            valores = series[nome]
+            r = HistoricoMetricas.resumo(valores)
+            texto += md(
+                "*{}*\n"
+                "`{}`\n"
+                "  • Mín: {} | Méd: {}\n"
+                "  • Máx: {} | P95: {}\n\n",
+                titulo, HistoricoMetricas.sparkline(valores),
+                fmt(r['min']), fmt(r['avg']), fmt(r['max']), fmt(r['p95'])
+            )
+        
+        return texto
+    except Exception as e:
+        return escape_markdown(f"❌ Erro ao obter histórico: {e}")
+
+def executar_speedtest() -> Dict[str, Any]:
+    """Executa um teste de velocidade (bloqueante, rodar via executor)"""
+    import speedtest
+    s = speedtest.Speedtest(timeout=TIMEOUT_HTTP * 2)
+    s.get_best_server()
+    s.download()
+    s.upload()
+    return s.results.dict()
+
+def formatar_speedtest(resultado: Dict[str, Any], idade: float) -> str:
+    """Formata o resultado de um speed test"""
+    download = resultado["download"] / 1_000_000
+    upload = resultado["upload"] / 1_000_000
+    ping = resultado["ping"]
+    servidor = resultado["server"]["sponsor"]
+    cidade = resultado["server"]["name"]
     
-    elif query.data == MENU_REDE:
-        keyboard = [
-            [
-                InlineKeyboardButton("📊 Status", callback_data="rede_status"),
-                InlineKeyboardButton("🚀 Speed Test", callback_data="rede_speedtest")
-            ],
-            [
-                InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_PRINCIPAL)
-            ]
-        ]
-        await query.edit_message_text(
-            escape_markdown("🌐 *Menu Rede*\nEscolha uma opção:"),
-            reply_markup=InlineKeyboardMarkup(keyboard),
+    return md(
+        "🚀 *Resultado do Speed Test*\n\n"
+        "⬇️ *Download*: `{:.2f} Mbps`\n"
+        "⬆️ *Upload*: `{:.2f} Mbps`\n"
+        "🔄 *Ping*: `{:.0f} ms`\n"
+        "🌐 *Servidor*: `{} ({})`\n"
+        "🕒 *Medido*: {}\n",
+        download, upload, ping, servidor, cidade, formatar_idade(idade)
+    )
+
+class EnviadorMensagens:
+    """Envia mensagens respeitando os limites do Telegram, com retry e backoff"""
+
+    def __init__(self, por_segundo: float = ENVIOS_POR_SEGUNDO, intervalo_chat: float = INTERVALO_POR_CHAT,
+                 tentativas: int = TENTATIVAS_ENVIO):
+        self.por_segundo = por_segundo
+        self.intervalo_chat = intervalo_chat
+        self.tentativas = tentativas
+        self._fichas = float(por_segundo)
+        self._atualizado = time.monotonic()
+        self._proximo_por_chat: Dict[int, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def _aguardar_vez(self, chat_id: int):
+        async with self._lock:
+            # Token bucket global
+            while True:
+                agora = time.monotonic()
+                self._fichas = min(self.por_segundo, self._fichas + (agora - self._atualizado) * self.por_segundo)
+                self._atualizado = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    break
+                await asyncio.sleep((1 - self._fichas) / self.por_segundo)
+            # Reserva o próximo horário livre do chat
+            horario = max(agora, self._proximo_por_chat.get(chat_id, 0.0))
+            self._proximo_por_chat[chat_id] = horario + self.intervalo_chat
+        if horario > agora:
+            await asyncio.sleep(horario - agora)
+
+    async def enviar(self, bot, chat_id: int, texto: str, **kwargs) -> bool:
+        """Envia uma mensagem; retorna False se todas as tentativas falharem"""
+        for tentativa in range(self.tentativas):
+            await self._aguardar_vez(chat_id)
+            try:
+                await bot.send_message(chat_id=chat_id, text=texto, **kwargs)
+                return True
+            except RetryAfter as e:
+                logger.warning(f"Flood control para {chat_id}, aguardando {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except NetworkError as e:
+                espera = 2 ** tentativa
+                logger.warning(f"Falha de rede ao enviar para {chat_id} ({e}), nova tentativa em {espera}s")
+                await asyncio.sleep(espera)
+            except TelegramError as e:
+                logger.error(f"Erro ao enviar mensagem para {chat_id}: {e}")
+                return False
+        logger.error(f"Desistindo de enviar mensagem para {chat_id} após {self.tentativas} tentativas")
+        return False
+
+    async def difundir(self, bot, chat_ids: List[int], texto: str, **kwargs) -> int:
+        """Envia a mesma mensagem para vários chats; retorna quantos receberam"""
+        resultados = await asyncio.gather(*(self.enviar(bot, chat_id, texto, **kwargs) for chat_id in chat_ids))
+        return sum(resultados)
+
+enviador = EnviadorMensagens()
+
+class LimitadorUsuarios:
+    """Token bucket por usuário para as requisições recebidas"""
+
+    def __init__(self, por_segundo: float = REQUISICOES_POR_SEGUNDO, rajada: int = RAJADA_REQUISICOES):
+        self.por_segundo = por_segundo
+        self.rajada = rajada
+        # usuário -> [fichas, última atualização, já avisado]
+        self._baldes: "OrderedDict[int, list]" = OrderedDict()
+
+    def permitir(self, usuario: int) -> Optional[bool]:
+        """True se permitido; False se excedeu (avisar); None se excedeu e já foi avisado"""
+        agora = time.monotonic()
+        balde = self._baldes.pop(usuario, None)
+        if balde is None:
+            balde = [float(self.rajada), agora, False]
+        else:
+            balde[0] = min(self.rajada, balde[0] + (agora - balde[1]) * self.por_segundo)
+            balde[1] = agora
+        self._baldes[usuario] = balde
+        while len(self._baldes) > MAX_USUARIOS_LIMITADOR:
+            self._baldes.popitem(last=False)
+        
+        if balde[0] >= 1:
+            balde[0] -= 1
+            balde[2] = False
+            return True
+        if balde[2]:
+            return None
+        balde[2] = True
+        return False
+
+limitador_usuarios = LimitadorUsuarios()
+
+async def limitar_requisicoes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Middleware (grupo -1): descarta updates de quem excedeu o limite"""
+    user = update.effective_user
+    if user is None:
+        return
+    permitido = limitador_usuarios.permitir(user.id)
+    if permitido:
+        return
+    if permitido is False and update.callback_query:
+        await update.callback_query.answer("⏳ Muitas requisições, aguarde um instante")
+    raise ApplicationHandlerStop
+
+def montar_resumo_alertas(mensagens: List[str]) -> str:
+    """Junta os alertas (já em Markdown V2) de um mesmo ciclo em uma única mensagem"""
+    if len(mensagens) == 1:
+        return mensagens[0]
+    return md("🚨 *{} alertas*\n\n", len(mensagens)) + "\n\n".join(mensagens)
+
+async def verificar_sistema(bot, estado: Dict[str, Any]):
+    """Um ciclo de monitoramento: alimenta o histórico e envia alertas"""
+    amostra = amostrador.snapshot()
+    if amostra is None:
+        return
+    
+    historico.registrar(amostra)
+    
+    if time.monotonic() - estado.get("ultima_verificacao", 0.0) < INTERVALO_MONITORAMENTO:
+        return
+    estado["ultima_verificacao"] = time.monotonic()
+    
+    mensagens = motor_alertas.avaliar(amostra)
+    if NOTIFICACOES.get("servicos", True) and monitor_servicos.unidades:
+        try:
+            mensagens += await monitor_servicos.mudancas()
+        except Exception as e:
+            logger.warning(f"Falha ao verificar serviços: {e}")
+    ids_alertas = controle_acesso.ids_alertas
+    if mensagens and ids_alertas:
+        enviados = await enviador.difundir(
+            bot, ids_alertas,
+            montar_resumo_alertas(mensagens),
             parse_mode=ParseMode.MARKDOWN_V2
         )
+        logger.info(f"{len(mensagens)} alerta(s) enviados para {enviados}/{len(ids_alertas)} administradores")
+
+async def monitorar_sistema(context: ContextTypes.DEFAULT_TYPE):
+    """Job periódico de monitoramento"""
+    try:
+        await verificar_sistema(context.bot, context.job.data)
+    except Exception as e:
+        logger.error(f"Erro no monitoramento: {e}")
+
+async def _monitorar_sistema_loop(app: Application):
+    """Alternativa ao JobQueue quando o extra job-queue não está instalado"""
+    estado: Dict[str, Any] = {}
+    while True:
+        try:
+            await verificar_sistema(app.bot, estado)
+        except Exception as e:
+            logger.error(f"Erro no monitoramento: {e}")
+        await asyncio.sleep(RESOLUCAO_HISTORICO)
+
+def agendar_monitoramento(app: Application):
+    """Agenda o monitoramento no event loop da aplicação"""
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(
+            monitorar_sistema, interval=RESOLUCAO_HISTORICO, first=RESOLUCAO_HISTORICO,
+            data={}, name="monitoramento"
+        )
+        return
     
-    elif query.data == MENU_LOGS:
-        keyboard = [
-            [
-                InlineKeyboardButton("🖥️ Sistema", callback_data="logs_sistema"),
-                InlineKeyboardButton("🔒 Segurança", callback_data="logs_seguranca")
-            ],
-            [
-                InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_PRINCIPAL)
-            ]
-        ]
-        await query.edit_message_text(
-            escape_markdown("📝 *Menu Logs*\nEscolha uma opção:"),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
+    logger.warning("JobQueue indisponível (instale python-telegram-bot[job-queue]); usando tarefa asyncio")
+    post_init_anterior = app.post_init
+    
+    async def _post_init(application: Application):
+        if post_init_anterior:
+            await post_init_anterior(application)
+        application.create_task(_monitorar_sistema_loop(application))
+    app.post_init = _post_init
+
+def criar_servidor_webhook(app: Application, segredo: str, caminho: str) -> web.Application:
+    """Servidor aiohttp que valida o secret token e entrega os updates à aplicação"""
+    async def receber(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, segredo):
+            logger.warning(f"Webhook com secret token inválido vindo de {request.remote}")
+            return web.Response(status=403)
+        try:
+            dados = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        await app.update_queue.put(Update.de_json(dados, app.bot))
+        return web.Response()
+    
+    servidor = web.Application()
+    servidor.router.add_post(caminho, receber)
+    return servidor
+
+async def executar_webhook(app: Application):
+    """Alternativa ao long polling: o Telegram entrega os updates por HTTPS.
+
+    O aiohttp escuta em host:porta (normalmente atrás de um proxy reverso
+    com TLS); com `certificado` e `chave`, ele mesmo serve HTTPS e o
+    certificado é enviado ao Telegram.
+    """
+    url = CONFIG_WEBHOOK["url"].rstrip("/")
+    caminho = "/" + CONFIG_WEBHOOK.get("caminho", "telegram").strip("/")
+    segredo = CONFIG_WEBHOOK.get("segredo") or secrets.token_urlsafe(32)
+    certificado = CONFIG_WEBHOOK.get("certificado")
+    contexto_ssl = None
+    if certificado:
+        contexto_ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        contexto_ssl.load_cert_chain(certificado, CONFIG_WEBHOOK.get("chave"))
+    
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sinal, parar.set)
+    
+    async with app:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        
+        executor = web.AppRunner(criar_servidor_webhook(app, segredo, caminho), access_log=None)
+        await executor.setup()
+        site = web.TCPSite(
+            executor, CONFIG_WEBHOOK.get("host", "127.0.0.1"), CONFIG_WEBHOOK.get("porta", 8443),
+            ssl_context=contexto_ssl
+        )
+        await site.start()
+        
+        with open(certificado, 'rb') if certificado else contextlib.nullcontext() as arquivo_certificado:
+            await app.bot.set_webhook(
+                url + caminho,
+                certificate=arquivo_certificado,
+                secret_token=segredo,
+                allowed_updates=ATUALIZACOES_TRATADAS,
+                max_connections=CONFIG_WEBHOOK.get("max_conexoes", 40),
+                drop_pending_updates=CONFIG_WEBHOOK.get("descartar_pendentes", False)
+            )
+        logger.info(f"Webhook ativo em {url + caminho}")
+        
+        try:
+            await parar.wait()
+        finally:
+            logger.info("Encerrando webhook")
+            await executor.cleanup()
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+# Frota: agentes expõem os coletores por RPC HTTP autenticado e o
+# controlador consulta todos ao mesmo tempo
+class ErroRPC(Exception):
+    """O agente recusou a chamada ou respondeu com erro"""
+
+def _assinar_rpc(tempo: str, nonce: str, metodo: str, corpo: bytes) -> str:
+    """HMAC-SHA256 de tempo + nonce + método + corpo com o token da frota"""
+    mensagem = f"{tempo}.{nonce}.{metodo}.".encode() + corpo
+    return hmac.new(TOKEN_FROTA.encode(), mensagem, hashlib.sha256).hexdigest()
+
+async def resumo_host() -> Dict[str, Any]:
+    """Métricas principais do host, compactas para a visão da frota"""
+    amostra = await amostrador.snapshot_async()
+    if amostra is None:
+        raise ErroRPC("métricas ainda não coletadas")
+    montagens = amostra.get("montagens", {})
+    return {
+        "hostname": socket.gethostname(),
+        "cpu": amostra["cpu_percent"],
+        "ram": amostra["mem"].percent,
+        "disco": max((uso for uso, _ in montagens.values()), default=amostra["disk"].percent),
+        "load": amostra["load"][0],
+        "processos": amostra["processos"],
+        "uptime": time.time() - amostra["boot_time"],
+        "alertas": len(motor_alertas.ativos())
+    }
+
+async def _comando_validado(comando: str, usuario: int = 0) -> str:
+    """Executa um comando validado pela política local"""
+    controle_acesso.politica.analisar(comando)
+    saida = await executar_comando(comando)
+    return saida[-LIMITE_CAUDA_SAIDA:]
+
+async def _comando_rpc(comando: str, usuario: int = 0) -> str:
+    """No agente, comandos passam pelo agendador: mesmos limites que o /cmd local"""
+    controle_acesso.politica.analisar(comando)
+    try:
+        trabalho = agendador_comandos.enviar(
+            usuario, f"[frota] {comando}", lambda: _comando_validado(comando)
+        )
+    except FilaCheia:
+        raise ErroRPC("agente ocupado: fila de comandos cheia")
+    try:
+        return await asyncio.shield(trabalho.resultado)
+    except asyncio.CancelledError:
+        # O controlador desistiu (timeout ou /kill): encerra o comando também
+        agendador_comandos.cancelar(trabalho.id)
+        raise
+
+# Métodos expostos pelos agentes (e chamados direto para o host local)
+METODOS_RPC = {
+    "resumo": resumo_host,
+    "status": obter_status_sistema,
+    "processos": obter_processos,
+    "rede": obter_info_rede,
+    "comando": _comando_rpc
+}
+
+class NoncesVistos:
+    """Nonces aceitos dentro da janela de tempo, para recusar requisições repetidas"""
+
+    def __init__(self, janela: float = JANELA_ASSINATURA_RPC, maximo: int = MAX_NONCES_VISTOS):
+        self.janela = janela
+        self.maximo = maximo
+        self._vistos: "OrderedDict[str, float]" = OrderedDict()
+
+    def registrar(self, nonce: str) -> bool:
+        """Registra o nonce; False se ele já foi usado"""
+        agora = time.monotonic()
+        while self._vistos and (
+            next(iter(self._vistos.values())) < agora or len(self._vistos) >= self.maximo
+        ):
+            self._vistos.popitem(last=False)
+        if nonce in self._vistos:
+            return False
+        # O dobro da janela cobre requisições datadas até JANELA no futuro
+        self._vistos[nonce] = agora + 2 * self.janela
+        return True
+
+def criar_servidor_agente() -> web.Application:
+    """Servidor aiohttp do agente: POST /rpc/<método> com argumentos em JSON"""
+    vistos = NoncesVistos()
+    
+    async def rpc(request: web.Request) -> web.Response:
+        metodo = request.match_info["metodo"]
+        corpo = await request.read()
+        tempo = request.headers.get("X-Frota-Tempo", "")
+        nonce = request.headers.get("X-Frota-Nonce", "")
+        assinatura = request.headers.get("X-Frota-Assinatura", "")
+        try:
+            atraso = abs(time.time() - float(tempo))
+        except ValueError:
+            atraso = math.inf
+        # Tempo + nonce assinados: uma requisição capturada não pode ser repetida
+        if atraso > JANELA_ASSINATURA_RPC or not nonce or not hmac.compare_digest(
+            assinatura, _assinar_rpc(tempo, nonce, metodo, corpo)
+        ):
+            logger.warning(f"RPC com assinatura inválida vinda de {request.remote}")
+            return web.Response(status=403)
+        if not vistos.registrar(nonce):
+            logger.warning(f"RPC repetida vinda de {request.remote}")
+            return web.Response(status=403)
+        funcao = METODOS_RPC.get(metodo)
+        if funcao is None:
+            return web.Response(status=404)
+        try:
+            argumentos = json.loads(corpo or b"{}")
+            resultado = await funcao(**argumentos)
+        except (ComandoNegado, ErroRPC, TypeError, ValueError) as e:
+            return web.json_response({"ok": False, "erro": str(e)})
+        return web.json_response({"ok": True, "resultado": resultado})
+    
+    servidor = web.Application()
+    servidor.router.add_post("/rpc/{metodo}", rpc)
+    return servidor
+
+async def _avaliar_alertas_agente():
+    """No agente os alertas só são avaliados; o controlador mostra a contagem"""
+    while True:
+        amostra = amostrador.snapshot()
+        if amostra is not None:
+            historico.registrar(amostra)
+            motor_alertas.avaliar(amostra)
+        await asyncio.sleep(INTERVALO_MONITORAMENTO)
+
+async def executar_agente(porta: Optional[int] = None):
+    """Modo agente: só coleta métricas e atende o controlador, sem Telegram"""
+    if not TOKEN_FROTA:
+        raise ValueError("defina frota.token no config.json para usar o modo agente")
+    amostrador.iniciar()
+    tabela_processos.iniciar()
+    
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sinal, parar.set)
+    
+    contexto_ssl = None
+    if CONFIG_FROTA.get("certificado"):
+        contexto_ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        contexto_ssl.load_cert_chain(CONFIG_FROTA["certificado"], CONFIG_FROTA.get("chave"))
+    
+    host = CONFIG_FROTA.get("host", "127.0.0.1")
+    porta = porta or CONFIG_FROTA.get("porta", 8765)
+    # handler_cancellation: se o controlador desiste, o comando remoto também para
+    executor = web.AppRunner(criar_servidor_agente(), access_log=None, handler_cancellation=True)
+    await executor.setup()
+    await web.TCPSite(executor, host, porta, ssl_context=contexto_ssl).start()
+    logger.info(f"🛰️ Agente ouvindo em {host}:{porta}")
+    alertas = asyncio.create_task(_avaliar_alertas_agente())
+    try:
+        await parar.wait()
+    finally:
+        logger.info("Encerrando agente")
+        alertas.cancel()
+        executor_bloqueante.encerrar()
+        await executor.cleanup()
+        amostrador.parar()
+        tabela_processos.parar()
+
+class ClienteFrota:
+    """Chama os agentes por HTTP, reaproveitando conexões de um pool"""
+
+    def __init__(self, agentes: Dict[str, str], token: str, ca: Optional[str] = None):
+        self.agentes = {nome: url.rstrip("/") for nome, url in agentes.items()}
+        self.token = token
+        self.ca = ca
+        self._sessao: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def hosts(self) -> List[str]:
+        return [HOST_LOCAL, *self.agentes]
+
+    def _obter_sessao(self) -> aiohttp.ClientSession:
+        # Criada sob demanda: precisa do event loop em execução
+        if self._sessao is None or self._sessao.closed:
+            # Agentes https:// com certificado próprio: `ca` aponta para a CA que o assinou
+            contexto_ssl = ssl.create_default_context(cafile=self.ca) if self.ca else None
+            self._sessao = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=MAX_CONEXOES_FROTA, keepalive_timeout=60, ssl=contexto_ssl)
+            )
+        return self._sessao
+
+    async def chamar(self, host: str, metodo: str, timeout: float = TIMEOUT_RPC, **argumentos) -> Any:
+        """Executa `metodo` no host; o host local é atendido sem rede"""
+        if host == HOST_LOCAL:
+            # O controlador já roda comandos dentro de um trabalho do agendador
+            funcao = _comando_validado if metodo == "comando" else METODOS_RPC[metodo]
+            return await funcao(**argumentos)
+        url = self.agentes.get(host)
+        if url is None:
+            raise ErroRPC(f"host desconhecido: {host}")
+        
+        corpo = json.dumps(argumentos).encode()
+        tempo = f"{time.time():.3f}"
+        nonce = secrets.token_hex(16)
+        cabecalhos = {
+            "Content-Type": "application/json",
+            "X-Frota-Tempo": tempo,
+            "X-Frota-Nonce": nonce,
+            "X-Frota-Assinatura": _assinar_rpc(tempo, nonce, metodo, corpo)
+        }
+        async with self._obter_sessao().post(
+            f"{url}/rpc/{metodo}", data=corpo, headers=cabecalhos,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resposta:
+            if resposta.status != 200:
+                raise ErroRPC(f"HTTP {resposta.status}")
+            dados = await resposta.json()
+        if not dados.get("ok"):
+            raise ErroRPC(dados.get("erro") or "erro desconhecido")
+        return dados["resultado"]
+
+    async def difundir(self, metodo: str, hosts: Optional[List[str]] = None, **argumentos) -> Dict[str, Any]:
+        """Chama todos os hosts ao mesmo tempo; falhas voltam como exceções"""
+        hosts = hosts or self.hosts
+        resultados = await asyncio.gather(
+            *(self.chamar(host, metodo, **argumentos) for host in hosts),
+            return_exceptions=True
         )
+        return dict(zip(hosts, resultados))
+
+    async def fechar(self):
+        if self._sessao is not None:
+            await self._sessao.close()
+
+cliente_frota = ClienteFrota(AGENTES_FROTA, TOKEN_FROTA, CONFIG_FROTA.get("ca"))
+
+async def encerrar_recursos(app: Application):
+    """post_shutdown: descarta tarefas bloqueantes na fila e fecha as conexões da frota"""
+    executor_bloqueante.encerrar()
+    await cliente_frota.fechar()
+
+def _descrever_erro(erro: BaseException) -> str:
+    # TimeoutError e afins não têm mensagem
+    return str(erro) or type(erro).__name__
+
+@coalescer
+async def obter_status_frota() -> str:
+    """Resumo de todos os hosts, consultados em paralelo"""
+    inicio = time.monotonic()
+    resultados = await cliente_frota.difundir("resumo")
+    duracao = time.monotonic() - inicio
+    online = sum(not isinstance(r, BaseException) for r in resultados.values())
     
-    elif query.data == MENU_PRINCIPAL:
-        keyboard = [
-            [
-                InlineKeyboardButton("💻 Sistema", callback_data=MENU_SISTEMA),
-                InlineKeyboardButton("👥 Usuários", callback_data=MENU_USUARIOS)
+    texto = md("🛰️ *Status da Frota*\n{}/{} online · {:.0f} ms\n\n", online, len(resultados), duracao * 1000)
+    for host, resumo in resultados.items():
+        if isinstance(resumo, BaseException):
+            texto += md("🔴 *{}*: {}\n", host, _descrever_erro(resumo))
+            continue
+        dias, resto = divmod(int(resumo["uptime"]), 86400)
+        texto += md(
+            "{} *{}* ({})\n  CPU {:.0f}% · RAM {:.0f}% · Disco {:.0f}% · Load {:.2f} · ⏰ {}d {}h\n",
+            "🟠" if resumo["alertas"] else "🟢", host, resumo["hostname"],
+            resumo["cpu"], resumo["ram"], resumo["disco"], resumo["load"], dias, resto // 3600
+        )
+        if resumo["alertas"]:
+            texto += md("  ⚠️ {} alerta(s) ativo(s)\n", resumo["alertas"])
+    return texto
+
+@coalescer
+async def obter_visao_host(host: str, metodo: str) -> str:
+    """Uma das visões (status, processos, rede) de um host da frota"""
+    try:
+        texto = await cliente_frota.chamar(host, metodo)
+    except Exception as e:
+        return md("🔴 *{}*: {}", host, _descrever_erro(e))
+    return md("🖥️ *{}*\n\n", host) + texto
+
+async def executar_na_frota(alvo: str, comando: str, mensagem: Message, usuario: int):
+    """Executa o comando em um host ou em todos (`todos`) e mostra as saídas juntas"""
+    hosts = None if alvo == "todos" else [alvo]
+    await _editar_mensagem(mensagem, md("💻 *Comando* em {}: `{}`\n\n⏳ Executando...", alvo, comando[:200]))
+    try:
+        # Margem além do TIMEOUT_COMANDO para a fila do agente
+        resultados = await cliente_frota.difundir(
+            "comando", hosts, comando=comando, usuario=usuario, timeout=TIMEOUT_COMANDO + TIMEOUT_RPC
+        )
+    except asyncio.CancelledError:
+        await _editar_mensagem(mensagem, md("💻 *Comando* em {}: `{}`\n\n🛑 Comando interrompido", alvo, comando[:200]))
+        raise
+    partes = []
+    for host, saida in resultados.items():
+        if isinstance(saida, BaseException):
+            partes.append(md("🔴 *{}*: {}", host, _descrever_erro(saida)))
+        else:
+            partes.append(md("🖥️ *{}*\n", host) + f"```\n{escape_markdown_pre(saida.rstrip())}\n```")
+    resultado = "\n\n".join(partes)
+    if len(resultado) <= LIMITE_MENSAGEM:
+        await _editar_mensagem(mensagem, resultado)
+    else:
+        await _responder(mensagem, resultado)
+
+# Menus: textos escapados e teclados imutáveis, construídos uma única vez
+def _teclado(*linhas) -> InlineKeyboardMarkup:
+    """Monta um teclado a partir de linhas de (rótulo, callback_data)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(rotulo, callback_data=dados) for rotulo, dados in linha]
+        for linha in linhas
+    ])
+
+def _voltar(destino: str) -> tuple:
+    return ("⬅️ Voltar", destino)
+
+TECLADO_PRINCIPAL = _teclado(
+    [("💻 Sistema", MENU_SISTEMA), ("👥 Usuários", MENU_USUARIOS)],
+    [("🔧 Serviços", MENU_SERVICOS), ("🔒 Segurança", MENU_SEGURANCA)],
+    [("🌐 Rede", MENU_REDE), ("📝 Logs", MENU_LOGS)],
+    *([[("🛰️ Frota", MENU_FROTA)]] if AGENTES_FROTA else [])
+)
+
+TEXTO_BOAS_VINDAS = md(
+    "🤖 *Bem-vindo ao BOT-T-Terminal*\n\n"
+    "Controle e monitore seu servidor através deste bot.\n"
+    "Escolha uma opção abaixo:"
+)
+
+MENUS: Dict[str, tuple] = {
+    MENU_PRINCIPAL: (
+        md("🤖 *Menu Principal*\nEscolha uma opção:"),
+        TECLADO_PRINCIPAL
+    ),
+    MENU_SISTEMA: (
+        md("💻 *Menu Sistema*\nEscolha uma opção:"),
+        _teclado(
+            [("📊 Status", "status"), ("🔄 Processos", "processos")],
+            [("💾 Disco", "disco"), ("🧠 Memória", "memoria")],
+            [("📈 Histórico", MENU_HISTORICO)],
+            [_voltar(MENU_PRINCIPAL)]
+        )
+    ),
+    MENU_USUARIOS: (
+        md("👥 *Menu Usuários*\nEscolha uma opção:"),
+        _teclado(
+            [("👥 Listar", "usuarios_listar"), ("🔑 SSH", "usuarios_ssh")],
+            [_voltar(MENU_PRINCIPAL)]
+        )
+    ),
+    MENU_SERVICOS: (
+        md("🔧 *Menu Serviços*\nEscolha uma opção:"),
+        _teclado(
+            [("📊 Status", "servicos_status"), ("🔄 Reiniciar", "servicos_restart")],
+            [_voltar(MENU_PRINCIPAL)]
+        )
+    ),
+    MENU_SEGURANCA: (
+        md("🔒 *Menu Segurança*\nEscolha uma opção:"),
+        _teclado(
+            [("🔒 Firewall", "seguranca_firewall"), ("🛡️ Fail2Ban", "seguranca_fail2ban")],
+            [("🚨 Falhas SSH", "seguranca_ssh")],
+            [_voltar(MENU_PRINCIPAL)]
+        )
+    ),
+    MENU_REDE: (
+        md("🌐 *Menu Rede*\nEscolha uma opção:"),
+        _teclado(
+            [("📊 Status", "rede_status"), ("🚀 Speed Test", "rede_speedtest")],
+            [_voltar(MENU_PRINCIPAL)]
+        )
+    ),
+    MENU_LOGS: (
+        md("📝 *Menu Logs*\nEscolha uma opção:"),
+        _teclado(
+            *[
+                [(ROTULOS_LOGS.get(nome, f"📄 {nome}"), f"log:{nome}") for nome in list(LOGS_CONFIGURADOS)[i:i + 2]]
+                for i in range(0, len(LOGS_CONFIGURADOS), 2)
             ],
-            [
-                InlineKeyboardButton("🔧 Serviços", callback_data=MENU_SERVICOS),
-                InlineKeyboardButton("🔒 Segurança", callback_data=MENU_SEGURANCA)
+            [_voltar(MENU_PRINCIPAL)]
+        )
+    ),
+    MENU_HISTORICO: (
+        md("📈 *Histórico*\nEscolha o período:"),
+        _teclado(
+            [(f"🕐 {periodo}", f"historico:{periodo}") for periodo in PERIODOS_HISTORICO],
+            [_voltar(MENU_SISTEMA)]
+        )
+    ),
+    MENU_FROTA: (
+        md("🛰️ *Frota*\nEscolha um host:"),
+        _teclado(
+            [("📊 Status da frota", "frota_status")],
+            *[
+                [(f"🖥️ {host}", f"host:{host}") for host in cliente_frota.hosts[i:i + 2]]
+                for i in range(0, len(cliente_frota.hosts), 2)
             ],
-            [
-                InlineKeyboardButton("🌐 Rede", callback_data=MENU_REDE),
-                InlineKeyboardButton("📝 Logs", callback_data=MENU_LOGS)
-            ]
-        ]
-        await query.edit_message_text(
-            escape_markdown("🤖 *Menu Principal*\nEscolha uma opção:"),
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
+            [_voltar(MENU_PRINCIPAL)]
         )
+    )
+}
+
+TECLADOS_VOLTAR = {destino: _teclado([_voltar(destino)]) for destino in MENUS}
+
+TECLADO_FROTA_STATUS = _teclado([("🔄 Atualizar", "frota_status")], [_voltar(MENU_FROTA)])
+VISOES_HOST = {"status": "📊 Status", "processos": "🔄 Processos", "rede": "🌐 Rede"}
+
+@functools.lru_cache(maxsize=None)
+def _teclado_host(host: str) -> InlineKeyboardMarkup:
+    return _teclado(
+        [(rotulo, f"host:{host}:{visao}") for visao, rotulo in VISOES_HOST.items()],
+        [_voltar(MENU_FROTA)]
+    )
+
+TECLADOS_PROCESSOS = {
+    criterio: _teclado(
+        [(rotulo, f"processos:{chave}") for chave, rotulo in CRITERIOS_PROCESSOS.items() if chave != criterio],
+        [_voltar(MENU_SISTEMA)]
+    )
+    for criterio in CRITERIOS_PROCESSOS
+}
+
+TECLADO_SPEEDTEST = _teclado(
+    [("🔄 Rodar novamente", "rede_speedtest:novo")],
+    [_voltar(MENU_REDE)]
+)
+
+TECLADO_SERVICOS = _teclado(
+    [("🔄 Atualizar", "servicos_status:novo")],
+    [_voltar(MENU_SERVICOS)]
+)
+
+TECLADO_SEGURANCA_SSH = _teclado(
+    [("🔄 Atualizar", "seguranca_ssh")],
+    [_voltar(MENU_SEGURANCA)]
+)
+
+TEXTO_SPEEDTEST_OCUPADO = md("🚀 *Speed Test*\n\n⏳ Já existe um teste em andamento, aguarde o resultado.")
+TEXTO_SPEEDTEST_INICIANDO = md("🚀 *Speed Test*\n\n⏳ Iniciando teste de velocidade...\nIsso pode levar alguns segundos.")
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /start - Menu principal"""
+    if not await verificar_autorizacao(update):
+        return
     
-    elif query.data == "status":
-        status_texto = await obter_status_sistema()
-        keyboard = [[InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_SISTEMA)]]
-        await query.edit_message_text(
-            status_texto,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
-        )
+    await update.message.reply_text(
+        TEXTO_BOAS_VINDAS,
+        reply_markup=TECLADO_PRINCIPAL,
+        parse_mode=ParseMode.MARKDOWN_V2
+    )
+
+async def jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /jobs - Lista comandos em execução e na fila"""
+    if not await verificar_autorizacao(update):
+        return
     
-    elif query.data == "processos":
-        processos_texto = await obter_processos()
-        keyboard = [[InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_SISTEMA)]]
-        await query.edit_message_text(
-            processos_texto,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
-        )
+    trabalhos = agendador_comandos.listar()
+    tarefas = executor_bloqueante.listar()
+    agora = time.time()
+    if not trabalhos:
+        texto = md("📋 *Trabalhos*\n\nNenhum comando em execução ou na fila.")
+    else:
+        texto = md("📋 *Trabalhos* (máx. {} simultâneos)\n\n", agendador_comandos.max_concorrentes)
+        for t in trabalhos:
+            if t.estado == "executando":
+                situacao = f"▶️ executando há {agora - t.inicio:.0f}s"
+            else:
+                situacao = f"⏳ na fila há {agora - t.criado:.0f}s"
+            texto += md(
+                "🔹 *#{}* {}\n"
+                "  • Usuário: {}\n"
+                "  • Comando: `{}`\n\n",
+                t.id, situacao, t.usuario, t.descricao[:80]
+            )
+        texto += md("Use /kill <id> para cancelar.")
     
-    elif query.data == "rede_status":
-        rede_texto = await obter_info_rede()
-        keyboard = [[InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_REDE)]]
-        await query.edit_message_text(
-            rede_texto,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
+    if tarefas:
+        texto += md("\n\n⚙️ *Tarefas em segundo plano*\n\n")
+        for t in tarefas:
+            situacao = "▶️ executando" if t["rodando"] else "⏳ na fila"
+            texto += md("🔸 *t{}* {} há {:.0f}s: {}\n", t["id"], situacao, agora - t["inicio"], t["nome"])
+        texto += md("\nTarefas na fila podem ser canceladas com /kill t<id>.")
+    
+    await _responder(update.message, texto)
+
+async def kill(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /kill <id> - Cancela um comando agendado"""
+    if not await verificar_autorizacao(update):
+        return
+    
+    try:
+        alvo = context.args[0].lstrip("#")
+        tarefa = alvo.startswith("t")
+        id_trabalho = int(alvo[1:] if tarefa else alvo)
+    except (IndexError, ValueError):
+        await update.message.reply_text(escape_markdown("ℹ️ Uso: /kill <id> ou /kill t<id>"), parse_mode=ParseMode.MARKDOWN_V2)
+        return
+    
+    if tarefa:
+        # Só tarefas ainda na fila: uma thread em execução não pode ser interrompida
+        if executor_bloqueante.cancelar(id_trabalho):
+            texto = f"🛑 Tarefa t{id_trabalho} cancelada."
+        else:
+            texto = f"⚠️ Tarefa t{id_trabalho} não encontrada ou já em execução."
+    elif agendador_comandos.cancelar(id_trabalho):
+        texto = f"🛑 Trabalho #{id_trabalho} cancelado."
+    else:
+        texto = f"⚠️ Trabalho #{id_trabalho} não encontrado."
+    await update.message.reply_text(escape_markdown(texto), parse_mode=ParseMode.MARKDOWN_V2)
+
+async def cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /cmd <comando> - Executa um comando no servidor"""
+    if not await verificar_autorizacao(update):
+        return
+    
+    # O texto bruto preserva aspas e operadores que context.args perderia
+    comando = update.effective_message.text.partition(" ")[2].strip()
+    alvo = HOST_LOCAL
+    if comando.startswith("@"):
+        alvo, _, comando = comando[1:].partition(" ")
+        comando = comando.strip()
+    if not comando:
+        await _responder(update.effective_message, md("ℹ️ Uso: /cmd [@host|@todos] <comando>"))
+        return
+    
+    try:
+        argv = controle_acesso.politica.analisar(comando)
+    except ComandoNegado as e:
+        await _responder(update.effective_message, md("🚫 *Comando não permitido*: {}", str(e)))
+        return
+    
+    usuario = update.effective_user.id
+    if alvo == HOST_LOCAL:
+        mensagem = await _responder(update.effective_message, md("💻 *Comando*: `{}`\n\n⏳ Preparando...", comando[:200]))
+        descricao = comando
+        fabrica = lambda: executar_comando_streaming(comando, mensagem, argv=argv)
+    elif alvo == "todos" or alvo in cliente_frota.agentes:
+        # Remoto: o agente valida de novo com a própria política
+        mensagem = await _responder(update.effective_message, md("💻 *Comando* em {}: `{}`\n\n⏳ Preparando...", alvo, comando[:200]))
+        descricao = f"@{alvo} {comando}"
+        fabrica = lambda: executar_na_frota(alvo, comando, mensagem, usuario)
+    else:
+        await _responder(update.effective_message, md("⚠️ Host desconhecido: {}", alvo))
+        return
+    
+    try:
+        trabalho = agendador_comandos.enviar(usuario, descricao, fabrica)
+    except FilaCheia:
+        await _editar_mensagem(mensagem, md(
+            "⚠️ Você já tem {} comandos em execução ou na fila. Use /jobs para ver.",
+            agendador_comandos.max_fila_usuario
+        ))
+        return
+    if trabalho.estado == "fila":
+        await _editar_mensagem(mensagem, md(
+            "💻 *Comando*: `{}`\n\n⏳ Na fila (#{}). Use /kill {} para cancelar.",
+            comando[:200], trabalho.id, trabalho.id
+        ))
+
+async def _enviar_para_sessao(update: Update, sessao: SessaoShell, comando: str):
+    """Valida o comando e agenda sua execução na sessão"""
+    try:
+        controle_acesso.politica.analisar(comando, BUILTINS_SESSAO)
+    except ComandoNegado as e:
+        await _responder(update.effective_message, md("🚫 *Comando não permitido*: {}", str(e)))
+        return
+    if sessao.ocupada or sessao.trava.locked():
+        await _responder(update.effective_message, md("⏳ A sessão ainda está executando o comando anterior."))
+        return
+    
+    mensagem = await _responder(update.effective_message, md("🐚 `{}`\n\n⏳ Executando...", comando[:200]))
+    try:
+        agendador_comandos.enviar(
+            update.effective_user.id, f"[shell] {comando}",
+            lambda: executar_na_sessao(sessao, comando, mensagem)
         )
+    except FilaCheia:
+        await _editar_mensagem(mensagem, md(
+            "⚠️ Você já tem {} comandos em execução ou na fila. Use /jobs para ver.",
+            agendador_comandos.max_fila_usuario
+        ))
+
+async def shell(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /shell [comando|sair] - Sessão de shell persistente"""
+    if not await verificar_autorizacao(update):
+        return
+    if not SHELL_INTERATIVO:
+        await _responder(update.effective_message, md("🚫 Sessões de shell estão desativadas."))
+        return
     
-    elif query.data == "rede_speedtest":
-        await query.edit_message_text(
-            escape_markdown("🚀 *Speed Test*\n\n⏳ Iniciando teste de velocidade...\nIsso pode levar alguns segundos."),
-            parse_mode=ParseMode.MARKDOWN_V2
+    usuario = update.effective_user.id
+    argumento = update.effective_message.text.partition(" ")[2].strip()
+    if argumento == "sair":
+        if await fechar_sessao(usuario):
+            await _responder(update.effective_message, md("🔚 Sessão de shell encerrada."))
+        else:
+            await _responder(update.effective_message, md("ℹ️ Nenhuma sessão de shell aberta."))
+        return
+    
+    nova = usuario not in SESSOES_SHELL
+    try:
+        sessao = await abrir_sessao(usuario)
+    except FilaCheia:
+        await _responder(update.effective_message, md("⚠️ Limite de {} sessões de shell atingido.", MAX_SESSOES_SHELL))
+        return
+    except Exception as e:
+        logger.error(f"Erro ao abrir sessão de shell: {e}")
+        await _responder(update.effective_message, escape_markdown(f"❌ Erro ao abrir sessão de shell: {e}"))
+        return
+    
+    if argumento:
+        await _enviar_para_sessao(update, sessao, argumento)
+    elif nova:
+        await _responder(update.effective_message, md(
+            "🐚 *Sessão de shell aberta*\n\n"
+            "Envie comandos como mensagens normais; `cd` e variáveis persistem.\n"
+            "Encerre com /shell sair (ou após {} min sem uso).",
+            TEMPO_OCIOSO_SHELL // 60
+        ))
+    else:
+        await _responder(update.effective_message, md("🐚 Sua sessão de shell já está aberta."))
+
+async def mensagem_texto(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Texto livre vai para a sessão de shell do usuário, se houver uma"""
+    user = update.effective_user
+    sessao = SESSOES_SHELL.get(user.id) if user else None
+    if sessao is None or not await verificar_autorizacao(update):
+        return
+    await _enviar_para_sessao(update, sessao, update.effective_message.text)
+
+async def _enviar_arquivo(mensagem: Message, caminho: str, compressao: Optional[str]) -> int:
+    try:
+        with open(caminho, 'rb') as origem:
+            return await enviar_arquivo_em_partes(
+                mensagem, origem, os.path.basename(caminho), compressao, os.fstat(origem.fileno()).st_size
+            )
+    except Exception as e:
+        logger.error(f"Erro ao enviar {caminho}: {e}")
+        await _responder(mensagem, escape_markdown(f"❌ Erro ao enviar arquivo: {e}"))
+        return 0
+
+async def get(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /get <caminho> [gz|zst] - Envia um arquivo do servidor"""
+    if not await verificar_autorizacao(update):
+        return
+    
+    argumentos = update.effective_message.text.partition(" ")[2].strip()
+    caminho, compressao = argumentos, None
+    final = argumentos.rsplit(" ", 1)
+    if len(final) == 2 and final[1] in COMPRESSOES:
+        caminho, compressao = final[0].strip(), final[1]
+    if not caminho:
+        await _responder(update.effective_message, md("ℹ️ Uso: /get <caminho> [gz|zst]"))
+        return
+    # O caminho resolvido é o que é validado e aberto (links simbólicos inclusos)
+    caminho = os.path.realpath(os.path.expanduser(caminho))
+    
+    try:
+        controle_acesso.politica.verificar_leitura(caminho)
+    except ComandoNegado as e:
+        await _responder(update.effective_message, md("🚫 *Download não permitido*: {}", str(e)))
+        return
+    if not os.path.isfile(caminho):
+        await _responder(update.effective_message, md("⚠️ Arquivo não encontrado: `{}`", caminho))
+        return
+    if not os.access(caminho, os.R_OK):
+        await _responder(update.effective_message, md("🚫 Sem permissão para ler `{}`.", caminho))
+        return
+    if compressao == "zst" and zstandard is None:
+        await _responder(update.effective_message, md("⚠️ Compressão zstd indisponível; use gz."))
+        return
+    
+    tamanho = os.path.getsize(caminho)
+    if not tamanho:
+        await _responder(update.effective_message, md("⚠️ O arquivo `{}` está vazio.", caminho))
+        return
+    if tamanho > TAMANHO_PARTE_ENVIO and not compressao:
+        aviso = md("📤 Enviando `{}` ({:.1f} MB) em {} partes...", caminho, tamanho / 1024 / 1024,
+                   math.ceil(tamanho / TAMANHO_PARTE_ENVIO))
+    else:
+        aviso = md("📤 Enviando `{}` ({:.1f} MB)...", caminho, tamanho / 1024 / 1024)
+    mensagem = await _responder(update.effective_message, aviso)
+    try:
+        agendador_comandos.enviar(
+            update.effective_user.id, f"[get] {caminho}",
+            lambda: _enviar_arquivo(mensagem, caminho, compressao)
         )
-        
-        resultado = executar_speedtest()
-        keyboard = [[InlineKeyboardButton("⬅️ Voltar", callback_data=MENU_REDE)]]
-        await query.edit_message_text(
-            resultado,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN_V2
+    except FilaCheia:
+        await _editar_mensagem(mensagem, md(
+            "⚠️ Você já tem {} comandos em execução ou na fila. Use /jobs para ver.",
+            agendador_comandos.max_fila_usuario
+        ))
+
+async def tail(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /tail <log> [regex] - Acompanha um log ao vivo"""
+    if not await verificar_autorizacao(update):
+        return
+    
+    if not context.args:
+        disponiveis = ", ".join(LOGS_CONFIGURADOS)
+        await _responder(update.message, md("ℹ️ Uso: /tail <log> [regex]\nLogs: {}", disponiveis))
+        return
+    
+    padrao = " ".join(context.args[1:]) or None
+    await iniciar_tail(update.message, update.effective_user.id, context.args[0], padrao)
+
+# Roteamento de callbacks: "nome" ou "nome:argumento" -> handler
+ROTAS_CALLBACK: Dict[str, Any] = {}
+
+def rota_callback(*nomes: str):
+    """Registra um handler de callback para um ou mais nomes"""
+    def registrar(func):
+        for nome in nomes:
+            ROTAS_CALLBACK[nome] = func
+        return func
+    return registrar
+
+async def _editar(query, texto: str, teclado: Optional[InlineKeyboardMarkup] = None):
+    """Edita a mensagem do botão, paginando textos maiores que o limite"""
+    paginas = paginar(texto)
+    if len(paginas) > 1:
+        cache_paginas.guardar((query.message.chat_id, query.message.message_id), paginas, teclado)
+        texto, teclado = montar_pagina(paginas, 0, teclado)
+    await query.edit_message_text(texto, reply_markup=teclado, parse_mode=ParseMode.MARKDOWN_V2)
+
+async def _responder(mensagem: Message, texto: str, teclado: Optional[InlineKeyboardMarkup] = None):
+    """Responde a um comando, paginando textos maiores que o limite"""
+    paginas = paginar(texto)
+    if len(paginas) == 1:
+        return await mensagem.reply_text(texto, reply_markup=teclado, parse_mode=ParseMode.MARKDOWN_V2)
+    primeira, teclado_pagina = montar_pagina(paginas, 0, teclado)
+    enviada = await mensagem.reply_text(primeira, reply_markup=teclado_pagina, parse_mode=ParseMode.MARKDOWN_V2)
+    cache_paginas.guardar((enviada.chat_id, enviada.message_id), paginas, teclado)
+    return enviada
+
+@rota_callback("pag")
+async def callback_pagina(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    if arg is None:
+        return
+    entrada = cache_paginas.obter((query.message.chat_id, query.message.message_id))
+    if entrada is None:
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.message.reply_text(md("⌛ Páginas expiradas, abra a opção novamente."), parse_mode=ParseMode.MARKDOWN_V2)
+        return
+    paginas, teclado = entrada
+    indice = min(max(int(arg), 0), len(paginas) - 1)
+    texto, teclado = montar_pagina(paginas, indice, teclado)
+    await query.edit_message_text(texto, reply_markup=teclado, parse_mode=ParseMode.MARKDOWN_V2)
+
+@rota_callback(*MENUS)
+async def callback_menu(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    texto, teclado = MENUS[query.data]
+    await _editar(query, texto, teclado)
+
+@rota_callback("status")
+async def callback_status(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    await _editar(query, await obter_status_sistema(), TECLADOS_VOLTAR[MENU_SISTEMA])
+
+@rota_callback("processos")
+async def callback_processos(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    criterio = arg if arg in CRITERIOS_PROCESSOS else "cpu"
+    await _editar(query, await obter_processos(criterio=criterio), TECLADOS_PROCESSOS[criterio])
+
+@rota_callback("historico")
+async def callback_historico(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    if arg not in PERIODOS_HISTORICO:
+        texto, teclado = MENUS[MENU_HISTORICO]
+        await _editar(query, texto, teclado)
+        return
+    await _editar(query, await obter_historico(arg), TECLADOS_VOLTAR[MENU_HISTORICO])
+
+@rota_callback("rede_status")
+async def callback_rede_status(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    await _editar(query, await obter_info_rede(), TECLADOS_VOLTAR[MENU_REDE])
+
+@rota_callback("log")
+async def callback_log(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    nome, _, cursor = (arg or "").partition(":")
+    if nome not in LOGS_CONFIGURADOS:
+        texto, teclado = MENUS[MENU_LOGS]
+        await _editar(query, texto, teclado)
+        return
+    await _editar(query, *await obter_pagina_log(nome, cursor or None))
+
+@rota_callback("tail")
+async def callback_tail(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    await iniciar_tail(query.message, query.from_user.id, arg or "")
+
+@rota_callback("tail_parar")
+async def callback_tail_parar(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    entrada = SEGUIDORES.get(int(arg or 0))
+    if entrada is None:
+        await query.edit_message_reply_markup(reply_markup=None)
+        return
+    entrada[1].cancel()
+
+@rota_callback("frota_status")
+async def callback_frota_status(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    await _editar(query, await obter_status_frota(), TECLADO_FROTA_STATUS)
+
+@rota_callback("host")
+async def callback_host(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    host, _, visao = (arg or "").partition(":")
+    if host not in cliente_frota.hosts:
+        await _editar(query, *MENUS[MENU_FROTA])
+        return
+    teclado = _teclado_host(host)
+    if visao not in VISOES_HOST:
+        await _editar(query, md("🖥️ *{}*\nEscolha uma opção:", host), teclado)
+        return
+    await _editar(query, md("⏳ Consultando {}...", host))
+    await _editar(query, await obter_visao_host(host, visao), teclado)
+
+@rota_callback("disco")
+async def callback_disco(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    await _editar(query, *await obter_discos())
+
+@rota_callback("dir")
+async def callback_diretorio(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    identificador, _, opcao = (arg or "").partition(":")
+    caminho = _caminhos_callback.get(identificador)
+    if caminho is None:
+        await _editar(query, *await obter_discos())
+        return
+    await _editar(query, *await obter_diretorios(caminho, forcar=opcao == "novo"))
+
+@rota_callback("memoria")
+async def callback_memoria(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    await _editar(query, await obter_memoria(), TECLADOS_VOLTAR[MENU_SISTEMA])
+
+@rota_callback("servicos_status")
+async def callback_servicos_status(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    await _editar(query, await obter_status_servicos(forcar=arg == "novo"), TECLADO_SERVICOS)
+
+@rota_callback("seguranca_ssh")
+async def callback_seguranca_ssh(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    await _editar(query, await obter_falhas_ssh(), TECLADO_SEGURANCA_SSH)
+
+@rota_callback("rede_speedtest")
+async def callback_speedtest(query, context: ContextTypes.DEFAULT_TYPE, arg: Optional[str]):
+    forcar = arg == "novo"
+    em_cache = None if forcar else cache_ttl.consultar("speedtest")
+    if em_cache is not None:
+        await _editar(query, formatar_speedtest(*em_cache), TECLADO_SPEEDTEST)
+        return
+    
+    if executor_bloqueante.ocupado("speedtest"):
+        await _editar(query, TEXTO_SPEEDTEST_OCUPADO, TECLADOS_VOLTAR[MENU_REDE])
+        return
+    
+    await _editar(query, TEXTO_SPEEDTEST_INICIANDO)
+    
+    try:
+        dados, idade = await cache_ttl.obter(
+            "speedtest",
+            lambda: executor_bloqueante.executar(executar_speedtest, timeout=TIMEOUT_SPEEDTEST, grupo="speedtest"),
+            forcar=True
         )
+        resultado = formatar_speedtest(dados, idade)
+    except TarefaOcupada:
+        resultado = TEXTO_SPEEDTEST_OCUPADO
+    except asyncio.TimeoutError:
+        resultado = escape_markdown("⚠️ O speed test excedeu o tempo limite.")
+    except Exception as e:
+        resultado = escape_markdown(f"❌ Erro ao executar speedtest: {e}")
+    await _editar(query, resultado, TECLADO_SPEEDTEST)
+
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler para botões inline"""
+    if not await verificar_autorizacao(update):
+        return
+    
+    query = update.callback_query
+    nome, _, arg = (query.data or "").partition(":")
+    handler = ROTAS_CALLBACK.get(nome)
+    if handler is None:
+        await query.answer("🚧 Opção ainda não disponível")
+        return
+    
+    await query.answer()
+    await handler(query, context, arg or None)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Trata erros do bot"""
@@ -501,7 +4082,7 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if update and update.effective_message:
             await update.effective_message.reply_text(
-                escape_markdown("❌ *Erro*\nOcorreu um erro ao processar seu comando.\nO erro foi registrado e será analisado."),
+                md("❌ *Erro*\nOcorreu um erro ao processar seu comando.\nO erro foi registrado e será analisado."),
                 parse_mode=ParseMode.MARKDOWN_V2
             )
     except:
@@ -510,17 +4091,44 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def main():
     """Função principal"""
     try:
-        app = Application.builder().token(TOKEN).build()
+        # `python telegram_terminal_bot.py agente [porta]` sobrepõe o config
+        if CONFIG_FROTA.get("modo") == "agente" or sys.argv[1:2] == ["agente"]:
+            porta = int(sys.argv[2]) if len(sys.argv) > 2 else None
+            asyncio.run(executar_agente(porta))
+            return
+        if AGENTES_FROTA and not TOKEN_FROTA:
+            raise ValueError("frota.agentes configurados sem frota.token")
+        
+        # Updates concorrentes: uma tarefa longa não trava os demais usuários
+        construtor = Application.builder().token(TOKEN).concurrent_updates(True)
+        if URL_API:
+            url_api = URL_API.rstrip("/")
+            construtor = construtor.base_url(f"{url_api}/bot").base_file_url(f"{url_api}/file/bot")
+        app = construtor.build()
         
+        app.add_handler(TypeHandler(Update, limitar_requisicoes), group=-1)
         app.add_handler(CommandHandler("start", start))
+        app.add_handler(CommandHandler("cmd", cmd))
+        app.add_handler(CommandHandler("jobs", jobs))
+        app.add_handler(CommandHandler("kill", kill))
+        app.add_handler(CommandHandler("tail", tail))
+        app.add_handler(CommandHandler("shell", shell))
+        app.add_handler(CommandHandler("get", get))
+        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, mensagem_texto))
         app.add_handler(CallbackQueryHandler(button_handler))
         app.add_error_handler(error_handler)
+        app.post_shutdown = encerrar_recursos
         
-        monitoring_thread = threading.Thread(target=monitorar_sistema_thread, args=(app,), daemon=True)
-        monitoring_thread.start()
+        amostrador.iniciar()
+        tabela_processos.iniciar()
+        agendar_monitoramento(app)
         
-        logger.info("🚀 Bot iniciado!")
-        app.run_polling(allowed_updates=Update.ALL_TYPES)
+        if CONFIG_WEBHOOK.get("ativo"):
+            logger.info("🚀 Bot iniciado (webhook)!")
+            asyncio.run(executar_webhook(app))
+        else:
+            logger.info("🚀 Bot iniciado!")
+            app.run_polling(allowed_updates=ATUALIZACOES_TRATADAS)
         
     except Exception as e:
         logger.error(f"Erro fatal: {e}")